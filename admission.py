@@ -0,0 +1,119 @@
+"""Admission control for the CodeGeeX adapter.
+
+A global concurrency limit with a bounded wait queue. Waiters are grouped by
+client key and granted round-robin across clients, so one client with a deep
+batch cannot starve interactive users. Requests are rejected immediately when
+the queue is full, and time out after the configured queue deadline.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque
+
+
+class AdmissionRejected(Exception):
+    """The request could not be admitted; `reason` is 'queue_full' or 'timeout'."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Permit:
+    """One admitted request. release() is idempotent."""
+
+    __slots__ = ("_controller", "acquired_at", "wait_time", "_released")
+
+    def __init__(self, controller: "AdmissionController", wait_time: float):
+        self._controller = controller
+        self.acquired_at = time.monotonic()
+        self.wait_time = wait_time
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(time.monotonic() - self.acquired_at)
+
+
+class AdmissionController:
+    """Concurrency limiter with a bounded, per-client fair wait queue.
+
+    max_concurrent <= 0 disables limiting (requests are still counted).
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float, max_retry_after: int = 60):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retry_after = max_retry_after
+        self.active = 0
+        self.queued = 0
+        # 客户端 -> 等待队列；字典顺序即轮转顺序
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._avg_hold = 1.0
+
+    def _has_capacity(self) -> bool:
+        return self.max_concurrent <= 0 or self.active < self.max_concurrent
+
+    def retry_after(self) -> int:
+        """Estimated seconds until a queued request would be admitted."""
+        slots = max(self.max_concurrent, 1)
+        estimate = self._avg_hold * (self.queued + 1) / slots
+        return max(1, min(self.max_retry_after, math.ceil(estimate)))
+
+    async def acquire(self, client: str) -> Permit:
+        if self._has_capacity() and not self.queued:
+            self.active += 1
+            return Permit(self, 0.0)
+
+        if self.queued >= self.max_queue:
+            raise AdmissionRejected("queue_full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client, deque()).append(future)
+        self.queued += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # 恰好在放弃等待时被授予了名额，归还它
+                self._release(0.0)
+            else:
+                self._discard(client, future)
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionRejected("timeout", self.retry_after()) from None
+            raise
+        return Permit(self, time.monotonic() - start)
+
+    def _discard(self, client: str, future: asyncio.Future):
+        queue = self._waiters.get(client)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self.queued -= 1
+            if not queue:
+                del self._waiters[client]
+
+    def _release(self, held: float):
+        self.active -= 1
+        if held:
+            self._avg_hold = 0.9 * self._avg_hold + 0.1 * held
+        self._grant_next()
+
+    def _grant_next(self):
+        while self._waiters and self._has_capacity():
+            client, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._waiters.move_to_end(client)
+            else:
+                del self._waiters[client]
+            if future.done():
+                continue
+            future.set_result(None)
+            self.active += 1
@@ -0,0 +1,74 @@
+"""Attach to a Chrome that is already running instead of launching one.
+
+open.py starts Chrome with a chosen profile and --remote-debugging-port=9123.
+With CDP_ENDPOINT set (a port such as 9123, or http://127.0.0.1:9123), main.py
+and daemon.py use AttachedChrome. Its start() connects to that browser and
+opens its own tab, by default in a fresh isolated browser context (like an
+incognito window), so the forum cookies never touch the user's profile.
+stop() and leaving the `async with` block dispose of that context (or close
+the tab) and disconnect; the browser process itself keeps running.
+
+pydoll resolves the DevTools websocket through http://localhost:<port>, so
+only local endpoints are supported.
+"""
+import logging
+from typing import Optional
+from urllib.parse import urlparse
+
+from pydoll.browser.chromium import Chrome
+from pydoll.exceptions import BrowserNotRunning
+
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+def parse_endpoint(endpoint: str) -> int:
+    """Port of a local CDP endpoint given as `9123`, `localhost:9123` or `http://127.0.0.1:9123`."""
+    endpoint = endpoint.strip()
+    if endpoint.isdigit():
+        return int(endpoint)
+    parsed = urlparse(endpoint if "://" in endpoint else f"http://{endpoint}")
+    if parsed.hostname not in LOCAL_HOSTS or not parsed.port:
+        raise ValueError(f"只支持本机的 CDP 地址（如 9123 或 http://127.0.0.1:9123）: {endpoint!r}")
+    return parsed.port
+
+
+class AttachedChrome(Chrome):
+    """Chrome already listening on a local CDP port; start() attaches and stop() detaches."""
+
+    def __init__(self, options=None, connection_port: int = 9123, isolated: bool = True):
+        super().__init__(options=options, connection_port=connection_port)
+        self.isolated = isolated
+        self._context_id: Optional[str] = None
+        self._tab = None
+
+    async def start(self, headless: bool = False):
+        if not await self._is_browser_running(timeout=5):
+            logging.error(f"端口 {self._connection_port} 上没有可连接的浏览器，请先用 open.py 启动 Chrome")
+            raise BrowserNotRunning()
+        if self.isolated:
+            self._context_id = await self.create_browser_context()
+        self._tab = await self.new_tab(browser_context_id=self._context_id)
+        version = await self.get_version()
+        logging.info(f"已连接到运行中的浏览器 {version.get('product')}（端口 {self._connection_port}，"
+                     f"{'独立上下文' if self.isolated else '默认上下文'}）")
+        return self._tab
+
+    async def stop(self):
+        """Close the context or tab opened by start() and disconnect, leaving the browser running."""
+        try:
+            if self._context_id:
+                # 删除上下文会一并关闭其中的所有标签页
+                await self.delete_browser_context(self._context_id)
+            elif self._tab is not None:
+                await self._tab.close()
+        except Exception as e:
+            logging.warning(f"断开浏览器时清理标签页失败: {e}")
+        if self._tab is not None:
+            await self._tab._connection_handler.close()
+        self._context_id = None
+        self._tab = None
+        await self._connection_handler.close()
+        logging.info("已断开与浏览器的连接，浏览器继续运行")
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
@@ -0,0 +1,231 @@
+"""Engine benchmark: pydoll vs Playwright on the same local topic fixtures.
+
+Serves bench/fixtures/forum/topic.html from a local HTTP server, so no forum
+access is needed. Every topic id gets a deterministic page with a fixed
+number of posts. For each engine it measures:
+
+- launch: Engine.start() until the first page is ready;
+- per topic: time to the first .topic-post (TTI), then the whole visit
+  (scroll driver run plus reading the highest post), going through the
+  engine's page pool the same way pipeline.read_topics does;
+- memory: peak RSS of the browser's process tree, renderer RSS and the
+  page's JS heap.
+
+Rounds are interleaved across engines so that drift on the machine affects
+all of them alike. Engines whose library or browser is missing are skipped.
+
+Usage:
+    python bench/bench_engines.py                                    # pydoll and playwright-firefox
+    python bench/bench_engines.py --engines pydoll,playwright-chromium --topics 10 --rounds 3
+    python bench/bench_engines.py --posts 20,200 --scroll 2 --json bench-engines.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dom_extract import HIGHEST_POST_READ  # noqa: E402
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "forum")
+TOPIC_PATH_RE = re.compile(r"^/t/bench/(\d+)$")
+WORDS = ["Linux", "内核", "发行版", "配置", "终端", "脚本", "性能", "内存", "网络", "容器", "编译", "调度",
+         "systemd", "Wayland", "驱动", "补丁", "日志", "缓存", "文件系统", "权限"]
+
+POST_TEMPLATE = Template("""    <div class="topic-post" data-post-number="$number">
+      <article id="post_$number">
+        <div class="topic-avatar"></div>
+        <div class="topic-body">
+          <div class="names">user$user</div>
+          <div class="cooked">$paragraphs</div>
+          <div class="post-controls">#$number</div>
+        </div>
+      </article>
+    </div>""")
+
+
+def render_topic(template: Template, topic_id: int, posts: int) -> bytes:
+    rng = random.Random(topic_id)
+    blocks = []
+    for number in range(1, posts + 1):
+        paragraphs = "".join(
+            "<p>" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 60))) + "</p>"
+            for _ in range(rng.randint(1, 3)))
+        blocks.append(POST_TEMPLATE.substitute(number=number, user=rng.randint(1, 500), paragraphs=paragraphs))
+    return template.substitute(title=f"基准主题 {topic_id}", posts="\n".join(blocks)).encode("utf-8")
+
+
+def start_fixture_server(post_counts):
+    """HTTP server on a free local port; /t/bench/<id> is a topic with post_counts[id % n] posts."""
+    with open(os.path.join(FIXTURE_DIR, "topic.html"), "r", encoding="utf-8") as f:
+        template = Template(f.read())
+    cache = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            match = TOPIC_PATH_RE.match(self.path)
+            if not match:
+                self.send_error(404)
+                return
+            topic_id = int(match.group(1))
+            if topic_id not in cache:
+                cache[topic_id] = render_topic(template, topic_id, post_counts[topic_id % len(post_counts)])
+            body = cache[topic_id]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_engine(name: str, headed: bool):
+    """pydoll, or playwright-<firefox|chromium|webkit>; imports the library only when asked for."""
+    if name == "pydoll":
+        from pydoll.browser.chromium import Chrome
+
+        from engine_pydoll import PydollEngine
+        from main import build_options
+
+        options = build_options()
+        if not headed:
+            options.add_argument('--headless=new')
+        return PydollEngine(Chrome(options=options))
+    if name.startswith("playwright-"):
+        from engine_playwright import PlaywrightEngine
+
+        return PlaywrightEngine(name.split("-", 1)[1], headless=not headed)
+    raise ValueError(f"unknown engine {name!r}")
+
+
+async def bench_round(name: str, args, urls) -> dict:
+    engine = make_engine(name, args.headed)
+    start = time.perf_counter()
+    try:
+        await engine.start()
+        result = {"engine": name, "launch": time.perf_counter() - start, "tti": [], "topic": [],
+                  "peak_rss": 0, "peak_renderer": 0, "heap": []}
+        pool = engine.page_pool()
+        for url in urls:
+            page = await pool.acquire()
+            begin = time.perf_counter()
+            await engine.navigate(page, url, step="bench topic")
+            await engine.wait(page, ".topic-post", step="bench post")
+            result["tti"].append(time.perf_counter() - begin)
+            if args.scroll > 0:
+                await engine.scroll(page, args.scroll)
+            await engine.evaluate(page, HIGHEST_POST_READ)
+            result["topic"].append(time.perf_counter() - begin)
+
+            metrics = await engine.page_metrics(page)
+            if "JSHeapUsedSize" in metrics:
+                result["heap"].append(metrics["JSHeapUsedSize"])
+            memory = await engine.memory()
+            result["peak_rss"] = max(result["peak_rss"], memory["total"])
+            result["peak_renderer"] = max(result["peak_renderer"], memory["renderer"])
+            await pool.release(page)
+        await pool.close()
+        result["pool"] = pool.summary()
+        return result
+    finally:
+        await engine.stop()
+
+
+def percentile(values, pct: float):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name: str, rounds) -> dict:
+    tti = [value for result in rounds for value in result["tti"]]
+    topic = [value for result in rounds for value in result["topic"]]
+    heap = [value for result in rounds for value in result["heap"]]
+    return {
+        "engine": name,
+        "rounds": len(rounds),
+        "launch p50 s": round(statistics.median(result["launch"] for result in rounds), 2),
+        "TTI p50 ms": round(percentile(tti, 50) * 1000),
+        "TTI p90 ms": round(percentile(tti, 90) * 1000),
+        "topic p50 ms": round(percentile(topic, 50) * 1000),
+        "topic p90 ms": round(percentile(topic, 90) * 1000),
+        "peak rss MB": round(max(result["peak_rss"] for result in rounds) / 1024 / 1024),
+        "renderer MB": round(max(result["peak_renderer"] for result in rounds) / 1024 / 1024),
+        "heap MB": round(statistics.median(heap) / 1024 / 1024, 1) if heap else "-",
+    }
+
+
+async def run(args):
+    post_counts = [int(value) for value in args.posts.split(",")]
+    server = start_fixture_server(post_counts)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base}/t/bench/{topic_id}" for topic_id in range(1, args.topics + 1)]
+    engines = [name.strip() for name in args.engines.split(",") if name.strip()]
+    results = {name: [] for name in engines}
+    try:
+        for round_index in range(args.rounds):
+            for name in list(engines):
+                try:
+                    results[name].append(await bench_round(name, args, urls))
+                except Exception as e:
+                    print(f"skip {name}: {type(e).__name__}: {e}")
+                    engines.remove(name)
+                    continue
+                print(f"round {round_index + 1}/{args.rounds} {name}: "
+                      f"launch {results[name][-1]['launch']:.2f} s")
+    finally:
+        server.shutdown()
+
+    rows = [summarize(name, rounds) for name, rounds in results.items() if rounds]
+    if not rows:
+        print("no engine could run")
+        return 1
+    print(f"{args.topics} topics x {args.rounds} rounds, posts per topic {post_counts}, scroll {args.scroll} s")
+    print(tabulate(rows, headers="keys", tablefmt="pretty"))
+    fastest = min(rows, key=lambda row: row["topic p50 ms"])
+    print(f"fastest per topic (p50): {fastest['engine']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summary": rows, "rounds": results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engines", default="pydoll,playwright-firefox",
+                        help="comma-separated: pydoll, playwright-firefox, playwright-chromium, playwright-webkit")
+    parser.add_argument("--topics", type=int, default=8, help="topics visited per round")
+    parser.add_argument("--rounds", type=int, default=3, help="browser launches per engine")
+    parser.add_argument("--posts", default="20,80,200", help="posts per topic, cycled over topic ids")
+    parser.add_argument("--scroll", type=float, default=2.0, help="scroll driver budget per topic (0 = no scrolling)")
+    parser.add_argument("--headed", action="store_true", help="show the browser windows")
+    parser.add_argument("--json", help="also write summary and raw samples to this file")
+    args = parser.parse_args()
+
+    # 引擎自己的等待日志会淹没结果表（main.py 导入时会把日志级别设回 INFO，所以直接屏蔽）
+    logging.disable(logging.INFO)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Microbenchmark: pydantic StreamResponse.json() vs StreamChunkEncoder.
+
+Usage: python bench/bench_stream_encoder.py [--tokens 20000] [--rounds 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geex import StreamChoice, StreamChunkEncoder, StreamResponse  # noqa: E402
+
+# pydantic v2 warns on every .json() call, which would distort the baseline
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+SAMPLE_PIECES = ["Hello", " world", "，", "你好", "世界", "\n", "```python", "\"quoted\"", "\\path", " 🙂", "def ", "x = 1"]
+
+
+def make_deltas(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    return ["".join(rng.choice(SAMPLE_PIECES) for _ in range(rng.randint(1, 4))) for _ in range(count)]
+
+
+def encode_with_pydantic(deltas, model, stream_id, created):
+    out = []
+    for delta in deltas:
+        chunk = StreamResponse(
+            id=stream_id,
+            created=created,
+            model=model,
+            choices=[StreamChoice(delta={"content": delta})],
+        )
+        out.append(f"data: {chunk.json()}\n\n".encode("utf-8"))
+    return out
+
+
+def encode_with_template(deltas, model, stream_id, created):
+    encoder = StreamChunkEncoder(model, stream_id=stream_id, created=created)
+    return [encoder.content(delta) for delta in deltas]
+
+
+def best_of(func, rounds, *args):
+    best = float("inf")
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    deltas = make_deltas(args.tokens)
+    params = (deltas, "claude-sonnet-4", "chatcmpl-bench", int(time.time()))
+
+    baseline_time, baseline = best_of(encode_with_pydantic, args.rounds, *params)
+    template_time, templated = best_of(encode_with_template, args.rounds, *params)
+
+    if baseline != templated:
+        mismatch = next(i for i, (a, b) in enumerate(zip(baseline, templated)) if a != b)
+        print(f"OUTPUT MISMATCH at delta {mismatch}:\n  {baseline[mismatch]!r}\n  {templated[mismatch]!r}")
+        sys.exit(1)
+
+    rows = [("pydantic .json()", baseline_time), ("StreamChunkEncoder", template_time)]
+    print(f"{args.tokens} deltas, best of {args.rounds} rounds (outputs identical)")
+    for name, elapsed in rows:
+        print(f"  {name:<20} {elapsed * 1000:9.1f} ms  {args.tokens / elapsed:12,.0f} tokens/s")
+    print(f"  speedup: {baseline_time / template_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
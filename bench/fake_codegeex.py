@@ -0,0 +1,120 @@
+"""Local stand-in for the CodeGeeX chatCodeSseV3 endpoint.
+
+Emits `add`/`finish` SSE events with a configurable token count and rate,
+re-chunks the byte stream at fixed or random boundaries (so UTF-8 characters
+and event separators get split), and can inject HTTP errors or abort streams
+before `finish`.
+
+Usage: python bench/fake_codegeex.py --port 9100 --tokens 300 --rate 200
+Then point geex.py at it: CODEGEEX_API_URL=http://127.0.0.1:9100/prod/code/chatCodeSseV3/chat
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+VOCAB = ["Hello", " world", "，", "你好", "世界", "\n", "```", "def ", "return", " 🙂", "x", " = ", "1", "。"]
+
+config = argparse.Namespace(
+    tokens=200,
+    rate=0.0,
+    first_token_delay=0.0,
+    chunk_size=0,
+    random_chunks=False,
+    error_rate=0.0,
+    error_status=500,
+    abort_rate=0.0,
+    seed=None,
+)
+rng = random.Random()
+app = FastAPI(title="Fake CodeGeeX SSE")
+
+
+def build_text(count: int):
+    return [rng.choice(VOCAB) for _ in range(count)]
+
+
+def sse_event(event: str, text: str) -> bytes:
+    return f"event: {event}\ndata: {json.dumps({'text': text}, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def event_stream(tokens, abort: bool):
+    pending = bytearray()
+
+    def take_chunks(final: bool):
+        while pending:
+            size = config.chunk_size
+            if config.random_chunks:
+                size = rng.randint(1, config.chunk_size)
+            if len(pending) < size and not final:
+                return
+            piece = bytes(pending[:size])
+            del pending[:size]
+            yield piece
+
+    if config.first_token_delay:
+        await asyncio.sleep(config.first_token_delay)
+
+    interval = 1.0 / config.rate if config.rate > 0 else 0.0
+    abort_at = rng.randint(0, len(tokens)) if abort else None
+    for index, token in enumerate(tokens):
+        if index == abort_at:
+            break
+        event = sse_event("add", token)
+        if config.chunk_size <= 0:
+            yield event
+        else:
+            pending += event
+            for piece in take_chunks(False):
+                yield piece
+        if interval:
+            await asyncio.sleep(interval)
+
+    if abort_at is None:
+        finish = sse_event("finish", "".join(tokens))
+        if config.chunk_size <= 0:
+            yield finish
+        else:
+            pending += finish
+    for piece in take_chunks(True):
+        yield piece
+
+
+@app.post("/prod/code/chatCodeSseV3/chat")
+async def chat(request: Request):
+    await request.body()
+    if config.error_rate and rng.random() < config.error_rate:
+        return JSONResponse({"msg": "injected error"}, status_code=config.error_status)
+
+    tokens = build_text(config.tokens)
+    abort = bool(config.abort_rate) and rng.random() < config.abort_rate
+    return StreamingResponse(event_stream(tokens, abort), media_type="text/event-stream")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fake CodeGeeX SSE upstream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--tokens", type=int, default=config.tokens, help="add events per response")
+    parser.add_argument("--rate", type=float, default=config.rate, help="tokens per second (0 = unthrottled)")
+    parser.add_argument("--first-token-delay", type=float, default=config.first_token_delay, help="seconds before the first event")
+    parser.add_argument("--chunk-size", type=int, default=config.chunk_size, help="re-chunk the body into N-byte writes (0 = one write per event)")
+    parser.add_argument("--random-chunks", action="store_true", help="use random chunk sizes in [1, chunk-size]")
+    parser.add_argument("--error-rate", type=float, default=config.error_rate, help="fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=config.error_status)
+    parser.add_argument("--abort-rate", type=float, default=config.abort_rate, help="fraction of streams cut before the finish event")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    args = parse_args()
+    for key, value in vars(args).items():
+        setattr(config, key, value)
+    rng.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
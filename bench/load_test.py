@@ -0,0 +1,187 @@
+"""Offline load test for geex.py against the fake CodeGeeX upstream.
+
+Starts bench/fake_codegeex.py and geex.py (uvicorn) as subprocesses on
+localhost, then drives /v1/chat/completions at increasing concurrency in
+stream and non-stream mode. Reports p50/p99 TTFT, tokens/sec and proxy CPU
+time per request. No network access is needed.
+
+Usage: python bench/load_test.py --concurrency 1,8,32 --requests 64 --tokens 300 --rate 500
+Extra arguments after `--` are passed to fake_codegeex.py, e.g. `-- --chunk-size 7 --random-chunks`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from tabulate import tabulate
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+CLIENT_KEY = "sk-bench"
+MODEL = "claude-sonnet-4"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_cpu_seconds(pid: int):
+    """utime + stime of a process from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def percentile(values, pct: float):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def wait_until_up(url: str, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def one_request(client: httpx.AsyncClient, url: str, stream: bool):
+    """Returns (ttft_seconds, duration_seconds, content_deltas, ok); deltas is None for non-stream."""
+    body = {"model": MODEL, "stream": stream, "messages": [{"role": "user", "content": "benchmark"}]}
+    start = time.perf_counter()
+    ttft = None
+    deltas = 0
+    async with client.stream("POST", url, json=body) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return None, time.perf_counter() - start, 0, False
+        if not stream:
+            json.loads(await response.aread())
+            duration = time.perf_counter() - start
+            return duration, duration, None, True
+        async for line in response.aiter_lines():
+            if not line.startswith("data: {"):
+                continue
+            chunk = json.loads(line[6:])
+            if chunk.get("choices") and chunk["choices"][0]["delta"].get("content"):
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                deltas += 1
+    return ttft, time.perf_counter() - start, deltas, True
+
+
+async def run_level(proxy_url: str, proxy_pid: int, concurrency: int, total: int, stream: bool, tokens: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"Authorization": f"Bearer {CLIENT_KEY}"}
+    results = []
+
+    async with httpx.AsyncClient(headers=headers, limits=limits, timeout=300) as client:
+        async def worker():
+            async with semaphore:
+                results.append(await one_request(client, proxy_url, stream))
+
+        cpu_before = process_cpu_seconds(proxy_pid)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(total)))
+        wall = time.perf_counter() - start
+        cpu_after = process_cpu_seconds(proxy_pid)
+
+    ok = [r for r in results if r[3]]
+    ttfts = [r[0] for r in ok if r[0] is not None]
+    # 非流式响应没有增量，按上游每次返回的 token 数计
+    units = sum(tokens if r[2] is None else r[2] for r in ok)
+    cpu_per_request = None
+    if cpu_before is not None and cpu_after is not None and results:
+        cpu_per_request = (cpu_after - cpu_before) / len(results) * 1000
+    return {
+        "mode": "stream" if stream else "non-stream",
+        "concurrency": concurrency,
+        "ok/total": f"{len(ok)}/{len(results)}",
+        "p50 TTFT ms": round(percentile(ttfts, 50) * 1000, 1),
+        "p99 TTFT ms": round(percentile(ttfts, 99) * 1000, 1),
+        "tokens/s": round(units / wall),
+        "req/s": round(len(ok) / wall, 1),
+        "proxy CPU ms/req": round(cpu_per_request, 2) if cpu_per_request is not None else "n/a",
+    }
+
+
+def start_servers(args, fake_args, workdir: str):
+    fake_port, proxy_port = free_port(), free_port()
+    fake_cmd = [sys.executable, os.path.join(BENCH_DIR, "fake_codegeex.py"), "--port", str(fake_port),
+                "--tokens", str(args.tokens), "--rate", str(args.rate), *fake_args]
+    fake = subprocess.Popen(fake_cmd)
+
+    with open(os.path.join(workdir, "client_api_keys.json"), "w", encoding="utf-8") as f:
+        json.dump([CLIENT_KEY], f)
+    with open(os.path.join(workdir, "codegeex.txt"), "w", encoding="utf-8") as f:
+        f.write("bench-token\n")
+
+    env = dict(os.environ)
+    env["CODEGEEX_API_URL"] = f"http://127.0.0.1:{fake_port}/prod/code/chatCodeSseV3/chat"
+    env["PYTHONPATH"] = REPO_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    proxy_cmd = [sys.executable, "-m", "uvicorn", "geex:app", "--host", "127.0.0.1",
+                 "--port", str(proxy_port), "--log-level", "warning"]
+    proxy = subprocess.Popen(proxy_cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL)
+    return fake, fake_port, proxy, proxy_port
+
+
+async def main_async(args, fake_args):
+    with tempfile.TemporaryDirectory() as workdir:
+        fake, fake_port, proxy, proxy_port = start_servers(args, fake_args, workdir)
+        try:
+            await wait_until_up(f"http://127.0.0.1:{fake_port}/docs")
+            await wait_until_up(f"http://127.0.0.1:{proxy_port}/models")
+            proxy_url = f"http://127.0.0.1:{proxy_port}/v1/chat/completions"
+
+            rows = []
+            for stream in (True, False):
+                for concurrency in args.concurrency:
+                    total = max(args.requests, concurrency)
+                    row = await run_level(proxy_url, proxy.pid, concurrency, total, stream, args.tokens)
+                    print(json.dumps(row, ensure_ascii=False), flush=True)
+                    rows.append(row)
+            print(tabulate(rows, headers="keys", tablefmt="pretty"))
+        finally:
+            for process in (proxy, fake):
+                process.terminate()
+                process.wait(timeout=10)
+
+
+def main():
+    argv = sys.argv[1:]
+    fake_args = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, fake_args = argv[:split], argv[split + 1:]
+
+    parser = argparse.ArgumentParser(description="geex.py offline load test")
+    parser.add_argument("--concurrency", default="1,4,16,64",
+                        type=lambda value: [int(v) for v in value.split(",") if v])
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--tokens", type=int, default=300, help="add events per upstream response")
+    parser.add_argument("--rate", type=float, default=0, help="upstream tokens per second (0 = unthrottled)")
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args, fake_args))
+
+
+if __name__ == "__main__":
+    main()
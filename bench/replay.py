@@ -0,0 +1,163 @@
+"""Golden-fixture replay for the CodeGeeX -> OpenAI conversion pipeline.
+
+Every raw upstream SSE body in bench/fixtures/ (*.sse, or *.sse.gz) is
+pushed through geex.py's stream and non-stream converters with randomized
+chunk boundaries. The output must match the recorded golden files
+byte-for-byte; per-fixture timings are reported alongside.
+
+Usage:
+    python bench/replay.py                 # verify against goldens
+    python bench/replay.py --rounds 50     # more random chunkings per fixture
+    python bench/replay.py --update        # re-record goldens after an intended change
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import os
+import random
+import statistics
+import sys
+import time
+import warnings
+
+import httpx
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geex  # noqa: E402
+
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+MODEL = "claude-sonnet-4"
+STREAM_ID = "chatcmpl-replay"
+CREATED = 1700000000
+
+
+def read_bytes(path: str) -> bytes:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        return f.read()
+
+
+def write_bytes(path: str, data: bytes):
+    if path.endswith(".gz"):
+        # mtime=0 keeps re-recorded goldens byte-stable
+        with gzip.GzipFile(path, "wb", mtime=0) as f:
+            f.write(data)
+    else:
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def golden_path(fixture: str, kind: str) -> str:
+    base, gz = (fixture[:-3], ".gz") if fixture.endswith(".gz") else (fixture, "")
+    return f"{base[:-len('.sse')]}.{kind}.golden{gz}"
+
+
+def random_chunks(data: bytes, rng: random.Random, max_size: int):
+    chunks, pos = [], 0
+    while pos < len(data):
+        size = rng.randint(1, max_size)
+        chunks.append(data[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def make_response(chunks) -> httpx.Response:
+    async def body():
+        for chunk in chunks:
+            yield chunk
+
+    return httpx.Response(200, content=body())
+
+
+async def run_stream(chunks) -> bytes:
+    trace = geex.RequestTrace(MODEL, True)
+    encoder = geex.StreamChunkEncoder(MODEL, stream_id=STREAM_ID, created=CREATED)
+    out = []
+    async for piece in geex._codegeex_stream_generator(make_response(chunks), MODEL, trace, encoder):
+        out.append(piece if isinstance(piece, bytes) else piece.encode("utf-8"))
+    return b"".join(out)
+
+
+async def run_non_stream(chunks) -> bytes:
+    trace = geex.RequestTrace(MODEL, False)
+    result = await geex._build_codegeex_non_stream_response(make_response(chunks), MODEL, trace)
+    trace.finish(200)
+    result.id = STREAM_ID
+    result.created = CREATED
+    return result.json().encode("utf-8")
+
+
+async def replay_fixture(path: str, rounds: int, max_chunk: int, rng: random.Random, update: bool):
+    raw = read_bytes(path)
+    name = os.path.basename(path)
+    row = {"fixture": name, "bytes": len(raw)}
+    failures = []
+
+    for kind, runner in (("stream", run_stream), ("non_stream", run_non_stream)):
+        golden_file = golden_path(path, kind)
+        if update:
+            write_bytes(golden_file, await runner([raw]))
+        expected = read_bytes(golden_file) if os.path.exists(golden_file) else None
+        if expected is None:
+            failures.append(f"{name} [{kind}]: no golden file, run with --update")
+            continue
+
+        timings = []
+        for index in range(rounds):
+            # 第一轮整体送入，其余轮次随机切分（包括切断多字节字符）
+            chunks = [raw] if index == 0 else random_chunks(raw, rng, max_chunk)
+            start = time.perf_counter()
+            output = await runner(chunks)
+            timings.append(time.perf_counter() - start)
+            if output != expected:
+                offset = next((i for i, (a, b) in enumerate(zip(output, expected)) if a != b),
+                              min(len(output), len(expected)))
+                failures.append(f"{name} [{kind}] round {index} ({len(chunks)} chunks): "
+                                f"output differs from golden at byte {offset}")
+                break
+
+        row[f"{kind} median ms"] = round(statistics.median(timings) * 1000, 3)
+        row[f"{kind} MB/s"] = round(len(raw) / statistics.median(timings) / 1e6, 1)
+    return row, failures
+
+
+async def main_async(args):
+    fixtures = sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.sse")) + glob.glob(os.path.join(FIXTURE_DIR, "*.sse.gz")))
+    if not fixtures:
+        print(f"No fixtures found in {FIXTURE_DIR}")
+        return 1
+
+    rng = random.Random(args.seed)
+    rows, failures = [], []
+    for path in fixtures:
+        row, fixture_failures = await replay_fixture(path, args.rounds, args.max_chunk, rng, args.update)
+        rows.append(row)
+        failures.extend(fixture_failures)
+
+    print(tabulate(rows, headers="keys", tablefmt="pretty"))
+    if args.update:
+        print(f"Recorded goldens for {len(fixtures)} fixtures.")
+    if failures:
+        print("\n".join(["FAILED:"] + failures))
+        return 1
+    print(f"All {len(fixtures)} fixtures byte-exact over {args.rounds} chunkings (seed {args.seed}).")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay golden SSE fixtures through geex.py")
+    parser.add_argument("--rounds", type=int, default=20, help="chunkings per fixture (first one is unsplit)")
+    parser.add_argument("--max-chunk", type=int, default=64, help="largest random chunk in bytes")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--update", action="store_true", help="re-record golden outputs")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Shared, persistent CDP sessions with round-trip accounting.
+
+pydoll gives every Browser and Tab one long-lived websocket
+(`_connection_handler`). session_for() wraps that handler once, so every
+command sent through it is counted and timed, whether it comes from our code
+or from pydoll's own element helpers. If the websocket drops, the CDP
+domains the tab had enabled are switched back on, because a new websocket
+starts with none of them enabled. The command itself is only retried on the
+fresh connection when resending it is harmless (reads, enable/disable,
+navigation); anything else may already have run in the browser, so the
+error goes to the caller.
+Domains pydoll does not track itself, such as Fetch with its interception
+patterns, are registered with keep_enabled() and re-sent as well.
+
+pipeline() sends independent commands back to back on the same socket and
+awaits all the replies together. It costs one round trip instead of one per
+command, and the browser still handles the commands in the order they were
+sent.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from pydoll.commands import NetworkCommands, PageCommands, RuntimeCommands
+from pydoll.exceptions import WebSocketConnectionClosed
+
+
+# 断线后可以安全重发的命令：除 get* 查询和 enable/disable 之外，只读或重复执行结果不变的命令
+RETRY_SAFE_METHODS = {
+    "DOM.describeNode",
+    "DOM.querySelector",
+    "DOM.querySelectorAll",
+    "Page.captureScreenshot",
+    "Page.navigate",
+}
+
+
+def retry_safe(method: str) -> bool:
+    """Whether a command may be sent again after the connection dropped mid-flight."""
+    action = method.rsplit(".", 1)[-1]
+    return method in RETRY_SAFE_METHODS or action in ("enable", "disable") or action.startswith("get")
+
+
+class CDPStats:
+    """Round trips, failures and latency for one run."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.round_trips = 0
+        self.failures = 0
+        self.reconnects = 0
+        self.total_latency = 0.0
+        # 方法名 -> [次数, 总耗时, 最大耗时]
+        self._methods = defaultdict(lambda: [0, 0.0, 0.0])
+        self._started = time.perf_counter()
+
+    def record(self, method: str, latency: float, failed: bool):
+        self.round_trips += 1
+        self.total_latency += latency
+        if failed:
+            self.failures += 1
+        entry = self._methods[method]
+        entry[0] += 1
+        entry[1] += latency
+        entry[2] = max(entry[2], latency)
+
+    def summary(self) -> dict:
+        return {
+            "round trips": self.round_trips,
+            "failures": self.failures,
+            "reconnects": self.reconnects,
+            "avg ms": round(self.total_latency / self.round_trips * 1000, 2) if self.round_trips else 0,
+            "total CDP s": round(self.total_latency, 2),
+            "run s": round(time.perf_counter() - self._started, 2),
+        }
+
+    def method_rows(self, limit: int = 15):
+        """Busiest methods first, for tabulate."""
+        rows = [
+            {"method": method, "count": count, "avg ms": round(total / count * 1000, 2),
+             "max ms": round(peak * 1000, 2)}
+            for method, (count, total, peak) in self._methods.items()
+        ]
+        rows.sort(key=lambda row: row["count"], reverse=True)
+        return rows[:limit]
+
+
+STATS = CDPStats()
+
+
+class CDPSession:
+    """Instrumented, reconnecting front for one pydoll ConnectionHandler."""
+
+    def __init__(self, owner, stats: CDPStats = STATS, retries: int = 1):
+        self.owner = owner
+        self.handler = owner._connection_handler
+        self.stats = stats
+        self.retries = retries
+        self._raw_execute = self.handler.execute_command
+        # 方法名 -> 重连后需要重新发送的开启命令
+        self._restore_commands = {}
+        # 所有经过该连接的命令（包括 pydoll 内部调用）都走这里
+        self.handler.execute_command = self.execute
+
+    async def execute(self, command, timeout: int = 10):
+        method = command.get("method", "?")
+        lost = False
+        for attempt in range(self.retries + 1):
+            socket_before = self.handler._ws_connection
+            start = time.perf_counter()
+            try:
+                response = await self._raw_execute(command, timeout=timeout)
+            except WebSocketConnectionClosed:
+                self.stats.record(method, time.perf_counter() - start, True)
+                self.stats.reconnects += 1
+                if attempt == self.retries or not retry_safe(method):
+                    # 命令可能已经在浏览器里执行过，不能盲目重发；先在新连接上恢复域，再把错误交给调用方
+                    await self._restore_after_failure()
+                    raise
+                logging.warning(f"CDP 连接断开，重连后重试 {method}")
+                lost = True
+                continue
+            except Exception:
+                self.stats.record(method, time.perf_counter() - start, True)
+                raise
+            self.stats.record(method, time.perf_counter() - start, "error" in response)
+            if socket_before is not None and self.handler._ws_connection is not socket_before:
+                # pydoll 在发送前静默重建了连接
+                self.stats.reconnects += 1
+                lost = True
+            if lost:
+                # 新连接上的域都是关闭的，需要重新开启
+                await self._restore_domains()
+            return response
+
+    async def pipeline(self, *commands, timeout: int = 10):
+        """Send commands back to back and await all replies; results keep input order."""
+        return await asyncio.gather(*(self.execute(command, timeout) for command in commands))
+
+    async def _restore_after_failure(self):
+        try:
+            await self._restore_domains()
+        except Exception as e:
+            logging.warning(f"CDP 重连后恢复域失败: {e}")
+
+    def keep_enabled(self, command: dict):
+        """Re-send this enable command after every reconnect; a later one for the same method replaces it."""
+        self._restore_commands[command["method"]] = command
+
+    async def _restore_domains(self):
+        commands = []
+        if getattr(self.owner, "page_events_enabled", False):
+            commands.append(PageCommands.enable())
+        if getattr(self.owner, "network_events_enabled", False):
+            commands.append(NetworkCommands.enable())
+        if getattr(self.owner, "runtime_events_enabled", False):
+            commands.append(RuntimeCommands.enable())
+        commands.extend(self._restore_commands.values())
+        if commands:
+            await asyncio.gather(*(self._raw_execute(command) for command in commands))
+
+
+def session_for(owner, stats: CDPStats = STATS) -> CDPSession:
+    """The shared session of a pydoll Browser or Tab, created on first use."""
+    handler = owner._connection_handler
+    session = getattr(handler, "_cdp_session", None)
+    if session is None:
+        session = CDPSession(owner, stats)
+        handler._cdp_session = session
+    return session
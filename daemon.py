@@ -0,0 +1,282 @@
+"""Long-lived daemon mode for main.py.
+
+    python daemon.py
+
+The process keeps one Chrome running and runs main.run_job() on it
+according to a cron-style schedule (DAEMON_SCHEDULE, the five standard
+fields) plus a random delay of up to DAEMON_JITTER seconds. A job therefore
+skips the launch and the profile load; the tab returns to about:blank while
+idle. Chrome is restarted before a job when it has been up longer than
+DAEMON_BROWSER_MAX_AGE, when its process tree uses more than
+DAEMON_BROWSER_MAX_RSS_MB, or after a job failed. With CDP_ENDPOINT set,
+the daemon attaches to that browser instead (see attach.py), and a restart
+only disconnects and reattaches.
+
+A flock on session/daemon.lock makes sure only one daemon runs per directory
+(on platforms without fcntl the lock is skipped). Each job is bounded by
+RUN_DEADLINE and appends its own run record, like a cron-started run.
+"""
+import asyncio
+import logging
+import os
+import random
+import signal
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from cdp_session import STATS as CDP_STATS
+from lean import LeanProfile
+from deadline import DEADLINE, log_budgets, run_until_deadline
+from engine_pydoll import PydollEngine
+from main import load_config, log_buffer, new_browser, read_settings, run_job
+from perf_watchdog import WATCHDOG_MAX_BROWSER_RESTARTS
+from readiness import reset_waits
+from run_record import RUN
+from session_store import SESSION_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+config = load_config()
+
+DAEMON_SCHEDULE = os.getenv("DAEMON_SCHEDULE", config.get('daemon', 'schedule', fallback='0 0 * * *'))
+DAEMON_JITTER = float(os.getenv("DAEMON_JITTER", config.get('daemon', 'jitter', fallback='600')))
+DAEMON_RUN_ON_START = os.getenv("DAEMON_RUN_ON_START", config.get('daemon', 'run_on_start', fallback='false')).lower() == 'true'
+DAEMON_BROWSER_MAX_AGE = float(os.getenv("DAEMON_BROWSER_MAX_AGE", config.get('daemon', 'browser_max_age', fallback=str(24 * 3600))))
+DAEMON_BROWSER_MAX_RSS_MB = float(os.getenv("DAEMON_BROWSER_MAX_RSS_MB", config.get('daemon', 'browser_max_rss_mb', fallback='1500')))
+DAEMON_LOCK_PATH = os.getenv("DAEMON_LOCK_PATH", os.path.join(SESSION_DIR, "daemon.lock"))
+
+
+class CronSchedule:
+    """Five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Supports `*`, lists, ranges and steps (`*/15`, `1-5`, `0,30`, `10-50/20`).
+    Day of week is 0-7 with both 0 and 7 meaning Sunday. As in cron, when both
+    day fields are restricted a day matches if either of them does.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 表达式需要 5 个字段: {expression!r}")
+        self.expression = expression
+        self.minutes = self._parse(fields[0], 0, 59)
+        self.hours = self._parse(fields[1], 0, 23)
+        self.days = self._parse(fields[2], 1, 31)
+        self.months = self._parse(fields[3], 1, 12)
+        self.weekdays = {day % 7 for day in self._parse(fields[4], 0, 7)}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> set:
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_text = part.split("/", 1)
+                step = int(step_text)
+                if step < 1:
+                    raise ValueError(f"cron 步长必须大于 0: {field!r}")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(value) for value in part.split("-", 1))
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"cron 字段超出范围 {low}-{high}: {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        # cron 中周日为 0，Python 的 weekday() 中周一为 0
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """The first matching minute strictly after `moment`."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                # 跳到下个月的第一天
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"cron 表达式没有可执行的时间: {self.expression!r}")
+
+
+class InstanceLock:
+    """Non-blocking exclusive flock; the holder's pid is written into the file."""
+
+    def __init__(self, path: str = DAEMON_LOCK_PATH):
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> bool:
+        if fcntl is None:
+            logging.warning("当前平台不支持 fcntl，跳过单实例锁")
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a+")
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.seek(0)
+            holder = self._file.read().strip() or "未知"
+            self._file.close()
+            self._file = None
+            logging.error(f"已有守护进程在运行（pid {holder}），退出")
+            return False
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(str(os.getpid()))
+        self._file.flush()
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+class WarmBrowser:
+    """One Chrome kept running between jobs and restarted on age, memory or failure."""
+
+    def __init__(self, lean: Optional[LeanProfile], max_age: float = DAEMON_BROWSER_MAX_AGE,
+                 max_rss_mb: float = DAEMON_BROWSER_MAX_RSS_MB):
+        self.lean = lean
+        self.max_age = max_age
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.engine = None
+        self.started_at = 0.0
+        self.broken = False
+        self.restarts = 0
+
+    async def _restart_reason(self) -> Optional[str]:
+        if self.engine is None:
+            return None
+        if self.broken:
+            return "上次任务失败"
+        age = time.monotonic() - self.started_at
+        if age > self.max_age:
+            return f"已运行 {age / 3600:.1f} 小时"
+        rss = (await self.engine.memory())["total"]
+        if rss > self.max_rss:
+            return f"内存占用 {rss / 1024 / 1024:.0f} MB"
+        return None
+
+    async def ensure(self):
+        """The running PydollEngine, starting or restarting Chrome first when needed."""
+        reason = await self._restart_reason()
+        if reason:
+            logging.info(f"重启浏览器：{reason}")
+            await self.close()
+            self.restarts += 1
+        if self.engine is None:
+            self.engine = PydollEngine(new_browser(config), self.lean)
+            await self.engine.start()
+            self.started_at = time.monotonic()
+            self.broken = False
+        return self.engine
+
+    async def idle(self):
+        """Park the tab on about:blank so the forum page does not keep polling between jobs."""
+        try:
+            await self.engine.navigate(self.engine.page, "about:blank", step="空闲页")
+        except Exception as e:
+            logging.warning(f"切换到空白页失败: {e}")
+            self.broken = True
+
+    async def close(self):
+        if self.engine is None:
+            return
+        await self.engine.stop()
+        self.engine = None
+
+
+async def run_scheduled_job(warm: WarmBrowser, settings: dict):
+    RUN.reset("pydoll-daemon")
+    CDP_STATS.reset()
+    reset_waits()
+    log_buffer.errors.clear()
+    DEADLINE.start()
+    ok = True
+    start_time = datetime.now()
+    logging.info(f"开始执行时间: {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+    try:
+        engine = await warm.ensure()
+        restarts = 0
+        while (await run_until_deadline(run_job(engine, settings))
+               and restarts < WATCHDOG_MAX_BROWSER_RESTARTS):
+            # 看门狗要求重启：换一个浏览器，从检查点继续剩下的主题
+            warm.broken = True
+            restarts += 1
+            RUN.count("browser_restarts")
+            engine = await warm.ensure()
+        await warm.idle()
+    except Exception as e:
+        ok = False
+        warm.broken = True
+        logging.error(f"运行过程中出错: {e}")
+    finally:
+        end_time = datetime.now()
+        logging.info(f"结束执行时间: {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
+        log_budgets()
+        RUN.write(ok, log_buffer.errors)
+
+
+async def serve():
+    settings = read_settings(config)
+    schedule = CronSchedule(DAEMON_SCHEDULE)
+    lock = InstanceLock()
+    if not lock.acquire():
+        return
+
+    lean = LeanProfile.from_config(config)
+    warm = WarmBrowser(lean)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, AttributeError):  # Windows 事件循环不支持
+            pass
+
+    logging.info(f"守护进程已启动（pid {os.getpid()}），计划 {DAEMON_SCHEDULE!r}，随机延迟最多 {DAEMON_JITTER:.0f} 秒")
+    run_now = DAEMON_RUN_ON_START
+    try:
+        while not stop.is_set():
+            if not run_now:
+                fire_at = schedule.next_after(datetime.now()) + timedelta(seconds=random.uniform(0, DAEMON_JITTER))
+                logging.info(f"下次运行时间: {fire_at.strftime('%Y-%m-%d %H:%M:%S')}")
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=max(0.0, (fire_at - datetime.now()).total_seconds()))
+                    break
+                except asyncio.TimeoutError:
+                    pass
+            run_now = False
+            await run_scheduled_job(warm, settings)
+    finally:
+        logging.info(f"守护进程退出，浏览器共重启 {warm.restarts} 次")
+        await warm.close()
+        lock.release()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
@@ -0,0 +1,188 @@
+"""Run deadline and time budgets.
+
+RUN_DEADLINE (seconds, 0 = no deadline) bounds a whole run. Each phase has
+its own budget: first navigation, login and discovery are hard limits
+enforced with DEADLINE.run(). A topic gets a soft budget (DEADLINE.soft())
+and its steps take their timeouts from what is left of it. The topic loop
+uses plan_topic() to spread the remaining time over the remaining topics.
+When time is short, topics get less scrolling, down to MIN_TOPIC_BUDGET.
+When even that no longer fits, the loop stops and leaves the rest to the
+checkpoint.
+
+DEADLINE_RESERVE seconds are kept free at the end for closing the browser,
+logging the summary and writing the run record. Budgets also never extend
+past that point. Every budget records how long it actually took and whether
+it was missed; rows() feeds the end-of-run table and the run record.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from tabulate import tabulate
+
+from run_record import RUN
+
+RUN_DEADLINE = float(os.getenv("RUN_DEADLINE", "0"))
+DEADLINE_RESERVE = float(os.getenv("DEADLINE_RESERVE", "60"))
+FIRST_NAVIGATION_BUDGET = float(os.getenv("FIRST_NAVIGATION_BUDGET", "120"))
+LOGIN_BUDGET = float(os.getenv("LOGIN_BUDGET", "180"))
+DISCOVERY_BUDGET = float(os.getenv("DISCOVERY_BUDGET", "120"))
+TOPIC_BUDGET = float(os.getenv("TOPIC_BUDGET", "75"))
+MIN_TOPIC_BUDGET = float(os.getenv("MIN_TOPIC_BUDGET", "20"))
+
+
+class DeadlineExceeded(TimeoutError):
+    def __init__(self, name: str, budget: float):
+        super().__init__(f"{name} 超出时间预算 {budget:.0f} 秒")
+        self.name = name
+        self.budget = budget
+
+
+class _Usage:
+    def __init__(self):
+        self.count = 0
+        self.budget = 0.0
+        self.used = 0.0
+        self.max = 0.0
+        self.misses = 0
+
+
+class Budget:
+    """A running soft budget: left() is what remains of it (never past the usable time)."""
+
+    def __init__(self, deadline: "Deadline", name: str, limit: float):
+        self.deadline = deadline
+        self.name = name
+        self.limit = limit
+        self.started = time.monotonic()
+
+    def left(self) -> float:
+        return max(0.0, min(self.limit - (time.monotonic() - self.started), self.deadline.usable()))
+
+    def end(self) -> float:
+        used = time.monotonic() - self.started
+        self.deadline._record(self.name, self.limit, used, used > self.limit)
+        if self.name == "topic":
+            # 用最近几个主题的平均耗时估计下一个主题需要多久
+            estimate = self.deadline._topic_estimate
+            self.deadline._topic_estimate = used if estimate is None else 0.7 * estimate + 0.3 * used
+        return used
+
+
+class Deadline:
+    """Wall-clock deadline of one run plus per-budget usage statistics."""
+
+    def __init__(self):
+        self.start()
+
+    def start(self, total: float = RUN_DEADLINE, reserve: float = DEADLINE_RESERVE):
+        self.total = total
+        self.reserve = reserve
+        self.started = time.monotonic()
+        self.usage = {}
+        self.stopped_early = 0
+        self._topic_estimate: Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.total > 0
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        """Seconds until the deadline itself (inf without a deadline)."""
+        return self.total - self.elapsed() if self.enabled else float("inf")
+
+    def usable(self) -> float:
+        """Seconds left for work once the reserve for shutdown and summary is kept back."""
+        return self.remaining() - self.reserve
+
+    def budget(self, seconds: float) -> float:
+        """A budget clipped to the usable time left."""
+        return max(0.0, min(seconds, self.usable()))
+
+    def _record(self, name: str, budget: float, used: float, missed: bool):
+        usage = self.usage.setdefault(name, _Usage())
+        usage.count += 1
+        usage.budget = budget
+        usage.used += used
+        usage.max = max(usage.max, used)
+        if missed:
+            usage.misses += 1
+            logging.warning(f"{name} 超出时间预算：预算 {budget:.0f} 秒，实际 {used:.1f} 秒")
+
+    async def run(self, name: str, awaitable, budget: float):
+        """Await with a hard limit of min(budget, usable time); raises DeadlineExceeded when it runs out."""
+        limit = self.budget(budget)
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(awaitable, timeout=limit)
+        except asyncio.TimeoutError:
+            used = time.monotonic() - start
+            if used < limit:
+                # 内部步骤自己的超时（如等待元素），不算超出预算
+                self._record(name, limit, used, False)
+                raise
+            self._record(name, limit, used, True)
+            raise DeadlineExceeded(name, limit) from None
+        self._record(name, limit, time.monotonic() - start, False)
+        return result
+
+    def soft(self, name: str, budget: float) -> "Budget":
+        """Start measuring a block against a budget it is not forced to keep; call end() when done."""
+        return Budget(self, name, budget)
+
+    def plan_topic(self, topics_left: int) -> Optional[float]:
+        """Budget for the next topic, or None if not even the smallest one fits before the deadline."""
+        if not self.enabled:
+            return TOPIC_BUDGET
+        usable = self.usable()
+        # 把剩余时间平均分给剩下的主题，但不超过单个主题的预算
+        share = usable / max(1, topics_left)
+        budget = max(MIN_TOPIC_BUDGET, min(TOPIC_BUDGET, share))
+        needed = min(budget, self._topic_estimate) if self._topic_estimate else budget
+        if usable < max(needed, MIN_TOPIC_BUDGET):
+            self.stopped_early += 1
+            return None
+        return min(budget, usable)
+
+    def rows(self):
+        """Per-budget usage for tabulate and the run record."""
+        return [{
+            "budget": name,
+            "count": usage.count,
+            "limit s": round(usage.budget, 1),
+            "used s": round(usage.used, 1),
+            "max s": round(usage.max, 1),
+            "misses": usage.misses,
+        } for name, usage in self.usage.items()]
+
+
+DEADLINE = Deadline()
+
+
+def log_budgets():
+    """Log the budget usage table and store it in the run record; safe to call after a forced stop."""
+    rows = DEADLINE.rows()
+    RUN.set("budgets", rows)
+    if rows:
+        logging.info("--------------时间预算使用情况-----------------")
+        logging.info("\n%s", tabulate(rows, headers="keys", tablefmt="pretty"))
+
+
+async def run_until_deadline(awaitable):
+    """Await the whole run, cancelling it once only DEADLINE_RESERVE is left before RUN_DEADLINE."""
+    if not DEADLINE.enabled:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(0.0, DEADLINE.usable()))
+    except asyncio.TimeoutError:
+        if DEADLINE.usable() > 0:
+            raise
+        # 保留的时间留给关闭浏览器、输出汇总和写入运行记录
+        logging.error(f"运行即将超过截止时间 {DEADLINE.total:.0f} 秒，已强制结束"
+                      f"（保留 {DEADLINE.reserve:.0f} 秒收尾）")
+        raise DeadlineExceeded("整个运行", DEADLINE.total - DEADLINE.reserve) from None
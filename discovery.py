@@ -0,0 +1,104 @@
+"""Topic discovery for the topic pipeline (works with either engine).
+
+Reads the topic list from Discourse's JSON endpoints (/unseen.json, then
+/latest.json) with fetch() inside the logged-in page. The page's session
+cookie is sent along, and only compact records cross the connection to the
+browser. Following more_topics_url also happens in the page, so discovery is
+a single evaluate call. When the JSON endpoints fail, it falls back to
+reading the rendered list with one bulk DOM extraction.
+"""
+import json
+import logging
+import random
+import re
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from dom_extract import TOPIC_ROWS
+
+JSON_SOURCES = ("/unseen.json?ascending=false&order=posts", "/latest.json")
+LIST_PAGE_PATH = "unseen?ascending=false&order=posts"
+TOPIC_HREF_RE = re.compile(r"/t/(?P<slug>[^/?#]+)/(?P<id>\d+)")
+
+_FETCH_SCRIPT = """async () => {
+  let url = %s;
+  const limit = %d;
+  const topics = [];
+  let pages = 0;
+  while (url && topics.length < limit && pages < 10) {
+    const response = await fetch(url, {credentials: 'same-origin', headers: {'Accept': 'application/json'}});
+    if (!response.ok) return {status: response.status, topics: topics, pages: pages};
+    const list = (await response.json()).topic_list || {};
+    pages += 1;
+    for (const t of list.topics || []) {
+      topics.push({id: t.id, slug: t.slug, title: t.title, pinned: !!t.pinned,
+                   last_read: t.last_read_post_number || 0, highest_post: t.highest_post_number || 0});
+    }
+    // more_topics_url 指向 HTML 页面，换成对应的 .json
+    url = list.more_topics_url ? list.more_topics_url.replace(/^([^?]*?)(\\.json)?(\\?|$)/, '$1.json$3') : null;
+  }
+  return {status: 200, topics: topics.slice(0, limit), pages: pages};
+}"""
+
+
+class TopicRecord(NamedTuple):
+    id: int
+    slug: str
+    title: str
+    pinned: bool = False
+    last_read: int = 0
+    highest_post: int = 0
+
+    def url(self, home_url: str) -> str:
+        return f"{home_url.rstrip('/')}/t/{self.slug}/{self.id}"
+
+
+async def fetch_topic_list(engine, page, path: str, limit: int) -> Optional[List[TopicRecord]]:
+    """Topics from one JSON list endpoint, or None if the request failed."""
+    try:
+        value = await engine.evaluate(page, _FETCH_SCRIPT % (json.dumps(path), limit)) or {}
+    except Exception as e:
+        logging.warning(f"读取 {path} 出错: {e}")
+        return None
+
+    if value.get("status") != 200 and not value.get("topics"):
+        logging.warning(f"读取 {path} 返回状态码 {value.get('status')}")
+        return None
+    return [TopicRecord(int(t["id"]), t["slug"], t["title"], t["pinned"], t["last_read"], t["highest_post"])
+            for t in value.get("topics", [])]
+
+
+async def discover_from_dom(engine, page, home_url: str, limit: int) -> List[TopicRecord]:
+    """The old path: open the unseen list, scroll it, and read the rendered rows."""
+    await engine.navigate(page, home_url.rstrip('/') + '/' + LIST_PAGE_PATH, step="未读列表加载")
+    await engine.wait(page, "#list-area .topic-list", step="未读列表渲染", raise_exc=False)
+    await engine.scroll(page, random.randint(5, 10))
+
+    records = []
+    # 整个列表一次取回，不再逐个元素读取属性和文本
+    for row in await engine.evaluate(page, TOPIC_ROWS) or []:
+        match = TOPIC_HREF_RE.search(row["href"])
+        if not match:
+            continue
+        records.append(TopicRecord(int(match.group("id")), match.group("slug"), row["title"], row["pinned"],
+                                   highest_post=row.get("highest_post") or 0))
+        if len(records) >= limit:
+            break
+    return records
+
+
+async def discover_topics(engine, page, home_url: str, limit: int) -> Tuple[List[TopicRecord], str]:
+    """Returns (records, source); source is the JSON path used or 'dom'."""
+    start = time.perf_counter()
+    records, source = [], "dom"
+    for path in JSON_SOURCES:
+        found = await fetch_topic_list(engine, page, path, limit)
+        if found:
+            records, source = found, path
+            break
+    if not records:
+        logging.info("JSON 接口没有返回主题，改为从页面列表读取")
+        records = await discover_from_dom(engine, page, home_url, limit)
+
+    logging.info(f"从 {source} 发现 {len(records)} 个主题，用时 {time.perf_counter() - start:.2f} 秒")
+    return records, source
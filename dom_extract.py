@@ -0,0 +1,50 @@
+"""Bulk DOM extraction scripts shared by both browser engines.
+
+Each script is a JavaScript arrow function that reads a whole view in one go
+and returns plain JSON. Collecting a page is a single evaluate call, instead
+of one round trip per element and attribute.
+"""
+
+# 主题列表：每行的标题、链接、是否置顶、主题 ID 和最后一楼的楼层号（未知为 0）
+TOPIC_ROWS = """() => Array.from(document.querySelectorAll('#list-area .title')).map((el) => {
+  const link = el.matches('a') ? el : el.querySelector('a');
+  if (!link || !link.getAttribute('href')) return null;
+  const row = el.closest('tr');
+  const href = link.getAttribute('href');
+  const match = href.match(/\\/t\\/[^/?#]+\\/(\\d+)/);
+  // 回复数列显示的是回复数（还会缩写成 1.2k），不能当楼层号；最后活动的链接指向最后一楼
+  const last = row && row.querySelector('td.activity a[href], .activity a[href]');
+  const lastMatch = last && last.getAttribute('href').match(/\\/t\\/[^/?#]+\\/\\d+\\/(\\d+)/);
+  const highest = row && row.dataset.highestPostNumber ? Number(row.dataset.highestPostNumber)
+    : (lastMatch ? Number(lastMatch[1]) : 0);
+  return {
+    title: (link.textContent || '').trim(),
+    href: href,
+    pinned: !!(row && row.querySelector('.topic-statuses .pinned')),
+    topic_id: row && row.dataset.topicId ? Number(row.dataset.topicId) : (match ? Number(match[1]) : null),
+    highest_post: highest || 0,
+  };
+}).filter(Boolean)"""
+
+# 主题页：已加载的帖子中最大的楼层号，即本次读到的位置
+HIGHEST_POST_READ = """() => Array.from(document.querySelectorAll('.topic-post article[id^="post_"]'))
+  .reduce((highest, el) => Math.max(highest, parseInt(el.id.slice(5), 10) || 0), 0)"""
+
+# connect 页面的表格：只保留至少三列的行（项目、当前、要求）
+CONNECT_TABLE_ROWS = """() => Array.from(document.querySelectorAll('table tr'))
+  .map((row) => Array.from(row.querySelectorAll('td'), (td) => (td.textContent || '').trim()))
+  .filter((cells) => cells.length >= 3)"""
+
+
+async def extract(tab, script: str):
+    """Run an extraction script on a pydoll tab (the Playwright engine uses page.evaluate)."""
+    # 延迟导入，只装了 Playwright 时也能使用本模块
+    from pydoll.commands import RuntimeCommands
+
+    # 异步脚本（返回 Promise）同样等待其结果
+    command = RuntimeCommands.evaluate(expression=f"({script})()", await_promise=True, return_by_value=True)
+    response = await tab._connection_handler.execute_command(command, timeout=30)
+    result = response.get("result", {})
+    if "exceptionDetails" in result:
+        raise RuntimeError(f"页面数据提取失败: {result['exceptionDetails'].get('text')}")
+    return result.get("result", {}).get("value")
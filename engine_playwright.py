@@ -0,0 +1,230 @@
+"""Async Playwright backend of the engine interface (see engines.py).
+
+PLAYWRIGHT_BROWSER picks firefox (the default, as ba-main.py always used),
+chromium or webkit, and PLAYWRIGHT_HEADLESS controls headless mode. The
+webdriver flag patch and the scroll driver are context init scripts, so
+every pooled page gets them. Page metrics come from a CDP session and are
+only available on chromium. Playwright timeouts are raised as the builtin
+TimeoutError, which is what the pipeline catches.
+
+Playwright does not expose the browser's pid. Memory is therefore measured
+over the children of this process (the driver and the browser), minus this
+process itself. The login session is kept as the forum's cookies, in the
+same form the pydoll engine stores.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+import weakref
+from typing import Optional
+
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import TimeoutError as PlaywrightTimeout
+from playwright.async_api import async_playwright
+
+from engines import (NETWORK_IDLE_MAX_INFLIGHT, NETWORK_IDLE_TIME, NETWORK_IDLE_TIMEOUT, PAGE_LOAD_TIMEOUT,
+                     SELECTOR_TIMEOUT, Engine)
+from perf_watchdog import METRIC_NAMES
+from proc_stats import rss_bytes
+from run_record import RUN
+from scroll_driver import DRIVER_SOURCE, RUN_AND_WAIT, run_options
+from session_store import site_cookies
+from tab_pool import PagePool
+
+PLAYWRIGHT_BROWSER = os.getenv("PLAYWRIGHT_BROWSER", "firefox")
+PLAYWRIGHT_HEADLESS = os.getenv("PLAYWRIGHT_HEADLESS", "true").lower() == "true"
+
+WEBDRIVER_PATCH = """
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined
+    });
+"""
+
+
+class PlaywrightEngine(Engine):
+    name = "playwright"
+
+    def __init__(self, browser_type: str = PLAYWRIGHT_BROWSER, headless: bool = PLAYWRIGHT_HEADLESS):
+        super().__init__()
+        self.browser_type = browser_type
+        self.headless = headless
+        self._playwright = None
+        self.browser = None
+        self.context = None
+        self._cdp = weakref.WeakKeyDictionary()
+
+    async def start(self):
+        with RUN.span("browser_launch"):
+            logging.info(f"以{'无头' if self.headless else '有界面'}模式启动 {self.browser_type}...")
+            self._playwright = await async_playwright().start()
+            self.browser = await getattr(self._playwright, self.browser_type).launch(headless=self.headless)
+        self.context = await self.browser.new_context()
+        await self.context.add_init_script(WEBDRIVER_PATCH)
+        await self.context.add_init_script(DRIVER_SOURCE)
+        self.page = await self.context.new_page()
+        return self.page
+
+    async def stop(self):
+        try:
+            if self.context is not None:
+                await self.context.close()
+            if self.browser is not None:
+                await self.browser.close()
+        except Exception as e:
+            logging.warning(f"关闭浏览器时出错: {e}")
+        if self._playwright is not None:
+            await self._playwright.stop()
+        self._playwright = self.browser = self.context = self.page = None
+
+    async def version(self) -> str:
+        return f"{self.browser_type} {self.browser.version}"
+
+    def pid(self) -> Optional[int]:
+        return os.getpid()
+
+    async def memory(self) -> dict:
+        usage = await super().memory()
+        # 进程树的根是本进程，只统计驱动和浏览器
+        usage["total"] = max(0, usage["total"] - (rss_bytes(os.getpid()) or 0))
+        return usage
+
+    def page_pool(self):
+        return PagePool(self.context)
+
+    async def navigate(self, page, url: str, timeout: float = PAGE_LOAD_TIMEOUT, step: str = "navigate") -> float:
+        start = time.perf_counter()
+        try:
+            await page.goto(url, timeout=timeout * 1000, wait_until="load")
+        except PlaywrightTimeout:
+            logging.warning(f"等待 {step} 超时，已等待 {time.perf_counter() - start:.2f} 秒")
+            raise TimeoutError(f"{step} 等待超过 {timeout:.1f} 秒") from None
+        elapsed = time.perf_counter() - start
+        logging.info(f"等待 {step} 完成，用时 {elapsed:.2f} 秒")
+        return elapsed
+
+    async def wait(self, page, selector: str, timeout: float = SELECTOR_TIMEOUT, step: str = None,
+                   raise_exc: bool = True) -> bool:
+        step = step or f"selector {selector}"
+        start = time.perf_counter()
+        try:
+            await page.wait_for_selector(selector, state="attached", timeout=timeout * 1000)
+            found = True
+        except PlaywrightTimeout:
+            found = False
+        except PlaywrightError as e:
+            # 等待期间页面跳转会销毁执行上下文
+            logging.warning(f"等待 {step} 时出错: {e}")
+            found = False
+        elapsed = time.perf_counter() - start
+        if not found:
+            logging.warning(f"等待 {step} 超时，已等待 {elapsed:.2f} 秒")
+            if raise_exc:
+                raise TimeoutError(f"{step} 等待超过 {timeout:.1f} 秒")
+        else:
+            logging.info(f"等待 {step} 完成，用时 {elapsed:.2f} 秒")
+        return found
+
+    async def settle(self, page, timeout: float = NETWORK_IDLE_TIMEOUT, step: str = "network idle") -> bool:
+        # load_state("networkidle") 要求完全没有请求，长轮询下永远等不到，这里和 pydoll 一样按在途数判断
+        inflight = set()
+        quiet_since = [time.perf_counter()]
+
+        def update():
+            if len(inflight) > NETWORK_IDLE_MAX_INFLIGHT:
+                quiet_since[0] = None
+            elif quiet_since[0] is None:
+                quiet_since[0] = time.perf_counter()
+
+        def on_request(request):
+            inflight.add(request)
+            update()
+
+        def on_done(request):
+            inflight.discard(request)
+            update()
+
+        page.on("request", on_request)
+        page.on("requestfinished", on_done)
+        page.on("requestfailed", on_done)
+        start = time.perf_counter()
+        deadline = start + timeout
+        try:
+            while True:
+                now = time.perf_counter()
+                if quiet_since[0] is not None and now - quiet_since[0] >= NETWORK_IDLE_TIME:
+                    logging.info(f"等待 {step} 完成，用时 {now - start:.2f} 秒")
+                    return True
+                if now >= deadline:
+                    logging.warning(f"等待 {step} 超时，已等待 {now - start:.2f} 秒")
+                    return False
+                await asyncio.sleep(min(0.05, deadline - now))
+        finally:
+            page.remove_listener("request", on_request)
+            page.remove_listener("requestfinished", on_done)
+            page.remove_listener("requestfailed", on_done)
+
+    async def evaluate(self, page, script: str):
+        try:
+            return await page.evaluate(script)
+        except PlaywrightError as e:
+            raise RuntimeError(f"页面数据提取失败: {e.message}") from None
+
+    async def click(self, page, selector: str, timeout: float = 2) -> bool:
+        try:
+            await page.locator(selector).first.click(timeout=timeout * 1000)
+        except PlaywrightTimeout:
+            return False
+        return True
+
+    async def type_text(self, page, selector: str, text: str, interval: float = 0.15) -> bool:
+        element = page.locator(selector).first
+        try:
+            await element.click(timeout=2000)
+        except PlaywrightTimeout:
+            return False
+        await element.press_sequentially(text, delay=interval * 1000)
+        return True
+
+    async def scroll(self, page, budget: float, settle: float = 1.5) -> dict:
+        options = run_options(uuid.uuid4().hex, budget, settle=settle)
+        start = time.perf_counter()
+        try:
+            report = await asyncio.wait_for(page.evaluate(RUN_AND_WAIT, options), budget + settle + 5)
+            if report is None:
+                # 初始化脚本没赶上当前文档时补注入一次
+                await page.evaluate(DRIVER_SOURCE)
+                report = await asyncio.wait_for(page.evaluate(RUN_AND_WAIT, options), budget + settle + 5)
+        except (asyncio.TimeoutError, PlaywrightError):
+            # 页面跳转或挂起时驱动不会回报
+            report = None
+        return report or {"reason": "timeout", "elapsed": int((time.perf_counter() - start) * 1000)}
+
+    async def screenshot(self, page, path: str):
+        await page.screenshot(path=path)
+
+    async def page_metrics(self, page) -> dict:
+        if self.browser_type != "chromium":
+            return {}
+        try:
+            session = self._cdp.get(page)
+            if session is None:
+                session = await self.context.new_cdp_session(page)
+                await session.send("Performance.enable")
+                self._cdp[page] = session
+            response = await session.send("Performance.getMetrics")
+        except PlaywrightError as e:
+            logging.warning(f"读取页面性能指标失败: {e}")
+            return {}
+        return {metric["name"]: metric["value"] for metric in response.get("metrics", [])
+                if metric["name"] in METRIC_NAMES}
+
+    async def export_session(self, home_url: str):
+        # 论坛的登录状态只在 cookie 里，不再保存整个 storage_state
+        return site_cookies(await self.context.cookies(), home_url)
+
+    async def restore_session(self, state):
+        # 兼容旧版本保存的 storage_state
+        cookies = state.get("cookies", []) if isinstance(state, dict) else state
+        await self.context.add_cookies(cookies)
@@ -0,0 +1,128 @@
+"""pydoll backend of the engine interface (see engines.py).
+
+Wraps the CDP helpers written for main.py. It uses event-driven waits from
+readiness.py, one-call extraction from dom_extract.py, the binding-based
+scroll driver, the shared CDP sessions and the optional lean-mode
+interception. The browser is a pydoll Chrome or an AttachedChrome; stop()
+leaves the latter running.
+"""
+import logging
+from typing import Optional
+
+from cdp_session import session_for
+from dom_extract import extract
+from engines import NETWORK_IDLE_TIMEOUT, PAGE_LOAD_TIMEOUT, SELECTOR_TIMEOUT, Engine
+from perf_watchdog import METRIC_NAMES
+from readiness import WaitTimeout, navigate, wait_for_network_idle, wait_for_selector
+from run_record import RUN
+from scroll_driver import scroll_driver_for
+from session_store import site_cookies
+from tab_pool import TabPool
+
+
+def browser_pid(browser):
+    """pid of the Chrome process pydoll launched, or None."""
+    process = getattr(browser._browser_process_manager, "_process", None)
+    return process.pid if process else None
+
+
+class PydollEngine(Engine):
+    name = "pydoll"
+
+    def __init__(self, browser, lean=None):
+        super().__init__()
+        self.browser = browser
+        self.lean = lean
+
+    async def start(self):
+        with RUN.span("browser_launch"):
+            tab = await self.browser.start()
+        # 浏览器与首个标签页各自一条长连接，整个运行期间共享
+        session_for(self.browser)
+        await self._prepare_tab(tab)
+        await tab.enable_auto_solve_cloudflare_captcha()
+        self.page = tab
+        return tab
+
+    async def _prepare_tab(self, tab):
+        session_for(tab)
+        if self.lean:
+            await self.lean.attach(tab)
+
+    async def stop(self):
+        try:
+            # Chrome 关闭进程，AttachedChrome 只断开连接
+            await self.browser.__aexit__(None, None, None)
+        except Exception as e:
+            logging.warning(f"关闭浏览器时出错: {e}")
+        self.page = None
+
+    async def version(self) -> str:
+        version = await self.browser.get_version()
+        return version.get("product", "")
+
+    def pid(self) -> Optional[int]:
+        return browser_pid(self.browser)
+
+    def page_pool(self):
+        # 新标签页和首个标签页在同一个浏览器上下文里（连接已有浏览器时是独立上下文）
+        return TabPool(self.browser, on_create=self._prepare_tab, browser_context_id=self.page._browser_context_id)
+
+    async def navigate(self, page, url: str, timeout: float = PAGE_LOAD_TIMEOUT, step: str = "navigate") -> float:
+        return await navigate(page, url, timeout=timeout, step=step)
+
+    async def wait(self, page, selector: str, timeout: float = SELECTOR_TIMEOUT, step: str = None,
+                   raise_exc: bool = True) -> bool:
+        return await wait_for_selector(page, selector, timeout=timeout, step=step, raise_exc=raise_exc)
+
+    async def settle(self, page, timeout: float = NETWORK_IDLE_TIMEOUT, step: str = "network idle") -> bool:
+        try:
+            await wait_for_network_idle(page, timeout=timeout, step=step)
+        except WaitTimeout:
+            return False
+        return True
+
+    async def evaluate(self, page, script: str):
+        return await extract(page, script)
+
+    async def click(self, page, selector: str, timeout: float = 2) -> bool:
+        element = await page.query(selector, timeout=int(timeout), raise_exc=False)
+        if not element:
+            return False
+        await element.click()
+        return True
+
+    async def type_text(self, page, selector: str, text: str, interval: float = 0.15) -> bool:
+        element = await page.query(selector, timeout=2, raise_exc=False)
+        if not element:
+            return False
+        await element.click()
+        await element.type_text(text, interval=interval)
+        return True
+
+    async def scroll(self, page, budget: float) -> dict:
+        return await scroll_driver_for(page).run(budget)
+
+    async def screenshot(self, page, path: str):
+        await page.take_screenshot(path=path)
+
+    async def page_metrics(self, page) -> dict:
+        session = session_for(page)
+        try:
+            socket = session.handler._ws_connection
+            # 重连后的新连接上 Performance 域是关闭的，需要重新开启
+            if socket is None or getattr(session, "_performance_socket", None) is not socket:
+                await session.execute({"method": "Performance.enable", "params": {}})
+                session._performance_socket = session.handler._ws_connection
+            response = await session.execute({"method": "Performance.getMetrics", "params": {}})
+        except Exception as e:
+            logging.warning(f"读取页面性能指标失败: {e}")
+            return {}
+        metrics = response.get("result", {}).get("metrics", [])
+        return {metric["name"]: metric["value"] for metric in metrics if metric["name"] in METRIC_NAMES}
+
+    async def export_session(self, home_url: str):
+        return site_cookies(await self.browser.get_cookies(self.page._browser_context_id), home_url)
+
+    async def restore_session(self, state):
+        await self.browser.set_cookies(state, self.page._browser_context_id)
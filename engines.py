@@ -0,0 +1,121 @@
+"""Browser engine interface for the shared forum pipeline.
+
+pipeline.py only talks to a browser through an Engine. The interface is
+narrow: navigate, wait for a selector or for the network to settle, query,
+evaluate an extraction script, click, type, scroll and take screenshots.
+Alongside these it covers the few things a run needs around them: a page
+pool for topic visits, exporting and restoring the login session, and
+sampling memory and page metrics. There are two backends:
+
+    engine_pydoll.PydollEngine         Chrome over CDP (main.py, daemon.py)
+    engine_playwright.PlaywrightEngine async Playwright (ba-main.py)
+
+Each backend module imports its own browser library, so a machine with only
+one of them installed can still run the matching script. Scripts passed to
+evaluate() are JavaScript arrow functions (see dom_extract.py); both
+backends await a returned Promise.
+"""
+import asyncio
+import json
+import os
+from typing import Optional
+
+from proc_stats import browser_memory
+
+# 各步骤的默认超时（秒），可用环境变量覆盖；两个引擎共用
+PAGE_LOAD_TIMEOUT = float(os.getenv("PAGE_LOAD_TIMEOUT", "30"))
+SELECTOR_TIMEOUT = float(os.getenv("SELECTOR_TIMEOUT", "20"))
+NETWORK_IDLE_TIMEOUT = float(os.getenv("NETWORK_IDLE_TIMEOUT", "15"))
+NETWORK_IDLE_TIME = float(os.getenv("NETWORK_IDLE_TIME", "0.5"))
+# Discourse 的 message-bus 长轮询会一直挂着，允许少量请求在途仍视为空闲
+NETWORK_IDLE_MAX_INFLIGHT = int(os.getenv("NETWORK_IDLE_MAX_INFLIGHT", "2"))
+
+
+class Engine:
+    """One browser plus its first page; use as `async with engine:` so stop() always runs."""
+
+    name = ""
+
+    def __init__(self):
+        self.page = None
+
+    async def start(self):
+        """Launch (or attach to) the browser and return its first page."""
+        raise NotImplementedError
+
+    async def stop(self):
+        """Close everything start() opened."""
+        raise NotImplementedError
+
+    async def __aenter__(self) -> "Engine":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def version(self) -> str:
+        raise NotImplementedError
+
+    def pid(self) -> Optional[int]:
+        """Root of the browser's process tree, for proc_stats."""
+        return None
+
+    async def memory(self) -> dict:
+        """browser_memory() of the browser; /proc is walked in a thread."""
+        return await asyncio.to_thread(browser_memory, self.pid())
+
+    def page_pool(self):
+        """A fresh pool (see tab_pool.py) of pages in the same browser context as the first page."""
+        raise NotImplementedError
+
+    async def navigate(self, page, url: str, timeout: float = PAGE_LOAD_TIMEOUT, step: str = "navigate") -> float:
+        """Navigate and wait for the load event; returns seconds waited, raises TimeoutError."""
+        raise NotImplementedError
+
+    async def wait(self, page, selector: str, timeout: float = SELECTOR_TIMEOUT, step: str = None,
+                   raise_exc: bool = True) -> bool:
+        """Wait for a CSS selector to match; False (or TimeoutError when raise_exc) on timeout."""
+        raise NotImplementedError
+
+    async def settle(self, page, timeout: float = NETWORK_IDLE_TIMEOUT, step: str = "network idle") -> bool:
+        """Wait until at most NETWORK_IDLE_MAX_INFLIGHT requests stay open for NETWORK_IDLE_TIME seconds.
+
+        Only requests started after the call are tracked. Returns False on
+        timeout instead of raising.
+        """
+        raise NotImplementedError
+
+    async def evaluate(self, page, script: str):
+        """Run an arrow-function script and return its JSON result; RuntimeError if the script throws."""
+        raise NotImplementedError
+
+    async def query(self, page, selector: str) -> bool:
+        """Whether the selector matches right now (no waiting)."""
+        return bool(await self.evaluate(page, f"() => !!document.querySelector({json.dumps(selector)})"))
+
+    async def click(self, page, selector: str, timeout: float = 2) -> bool:
+        """Click the first match; False when nothing matched within timeout."""
+        raise NotImplementedError
+
+    async def type_text(self, page, selector: str, text: str, interval: float = 0.15) -> bool:
+        """Focus the first match and type text key by key; False when nothing matched."""
+        raise NotImplementedError
+
+    async def scroll(self, page, budget: float) -> dict:
+        """Run the in-page scroll driver (scroll_driver.py) for up to budget seconds; returns its report."""
+        raise NotImplementedError
+
+    async def screenshot(self, page, path: str):
+        raise NotImplementedError
+
+    async def page_metrics(self, page) -> dict:
+        """perf_watchdog.METRIC_NAMES values of a page; empty when the engine cannot read them."""
+        return {}
+
+    async def export_session(self, home_url: str):
+        """Login state to hand to SessionStore.save()."""
+        raise NotImplementedError
+
+    async def restore_session(self, state):
+        """Put a state from export_session() back before the first navigation."""
+        raise NotImplementedError
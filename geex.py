@@ -1,16 +1,32 @@
+import asyncio
+import hashlib
 import json
 import os
 import time
 import uuid
 import threading
+from json.encoder import encode_basestring, encode_basestring_ascii
 from typing import Any, Dict, List, Optional, TypedDict, Union
 
-import requests
-from fastapi import FastAPI, HTTPException, Depends, Query
-from fastapi.responses import StreamingResponse
+import anyio
+import httpx
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
 
+from metrics import (
+    DEFAULT_COUNT_BUCKETS,
+    DEFAULT_SIZE_BUCKETS,
+    Counter,
+    Gauge,
+    Histogram,
+    render_prometheus,
+)
+from admission import AdmissionController, AdmissionRejected, Permit
+from response_cache import SingleFlight, TTLCache
+from sse_decoder import aiter_sse
+
 
 # CodeGeeX Token Management
 class CodeGeeXToken(TypedDict):
@@ -29,6 +45,62 @@ MAX_ERROR_COUNT = 3
 ERROR_COOLDOWN = 300  # 5 minutes cooldown for tokens with errors
 DEBUG_MODE = os.environ.get("DEBUG_MODE", "false").lower() == "true"
 
+# Upstream HTTP client (created on startup, shared by all requests)
+CODEGEEX_API_URL = os.environ.get("CODEGEEX_API_URL", "https://codegeex.cn/prod/code/chatCodeSseV3/chat")
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", "200"))
+UPSTREAM_MAX_KEEPALIVE = int(os.environ.get("UPSTREAM_MAX_KEEPALIVE", "50"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "10"))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", "300"))
+upstream_client: Optional[httpx.AsyncClient] = None
+DISCONNECT_POLL_INTERVAL = float(os.environ.get("DISCONNECT_POLL_INTERVAL", "1.0"))
+CLIENT_CLOSED_REQUEST = 499  # nginx 约定的"客户端主动断开"状态码
+
+# Admission control (ADMISSION_MAX_CONCURRENT=0 disables the limit)
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", "100"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "200"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "30"))
+admission = AdmissionController(ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+
+# Non-stream response cache (opt-in: RESPONSE_CACHE_SIZE > 0)
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "0"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "30"))
+CACHE_BYPASS_HEADER = "x-cache-bypass"
+response_cache: Optional[TTLCache] = TTLCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL) if RESPONSE_CACHE_SIZE > 0 else None
+inflight_requests = SingleFlight()
+
+# History compaction: newest pairs are kept within this many characters (0 = unlimited)
+HISTORY_CHAR_BUDGET = int(os.environ.get("HISTORY_CHAR_BUDGET", "0"))
+HISTORY_MIN_TRUNCATED_CHARS = int(os.environ.get("HISTORY_MIN_TRUNCATED_CHARS", "256"))
+
+# Metrics (exposed on /metrics)
+REQUESTS_TOTAL = Counter("geex_requests_total", "Chat completion requests by model and HTTP status.", ["model", "status"])
+REQUESTS_IN_FLIGHT = Gauge("geex_requests_in_flight", "Chat completion requests currently being served.", ["stream"])
+AUTH_FAILURES = Counter("geex_auth_failures_total", "Requests rejected by client authentication.", ["status"])
+REQUEST_DURATION = Histogram("geex_request_duration_seconds", "Total request duration, including streaming.", ["model", "stream"])
+UPSTREAM_RESPONSES = Counter("geex_upstream_responses_total", "Upstream CodeGeeX responses by HTTP status.", ["status"])
+UPSTREAM_LATENCY = Histogram("geex_upstream_headers_seconds", "Time from sending the upstream request to its response headers.")
+UPSTREAM_TTFB = Histogram("geex_upstream_first_byte_seconds", "Time from sending the upstream request to the first body byte.")
+FIRST_DELTA = Histogram("geex_time_to_first_delta_seconds", "Time from request arrival to the first content delta.", ["model"])
+STREAM_BYTES = Histogram("geex_upstream_bytes_per_request", "Upstream SSE bytes consumed per request.", buckets=DEFAULT_SIZE_BUCKETS)
+STREAM_EVENTS = Histogram("geex_upstream_events_per_request", "Upstream SSE events consumed per request.", buckets=DEFAULT_COUNT_BUCKETS)
+ADMISSION_QUEUE_DEPTH = Gauge("geex_admission_queue_depth", "Requests waiting for an admission slot.")
+ADMISSION_QUEUE_DEPTH.set_function(lambda: admission.queued)
+ADMISSION_ACTIVE = Gauge("geex_admission_active", "Requests holding an admission slot.")
+ADMISSION_ACTIVE.set_function(lambda: admission.active)
+ADMISSION_WAIT = Histogram("geex_admission_wait_seconds", "Time admitted requests spent in the wait queue.")
+ADMISSION_REJECTED = Counter("geex_admission_rejected_total", "Requests rejected by admission control.", ["reason"])
+CACHE_REQUESTS = Counter("geex_cache_requests_total", "Non-stream cache lookups by result (hit, miss, coalesced, bypass).", ["result"])
+CACHE_EVICTIONS = Counter("geex_cache_evictions_total", "Entries evicted from the response cache by LRU pressure.")
+CACHE_EVICTIONS.set_function(lambda: response_cache.evictions if response_cache else 0)
+CACHE_EXPIRATIONS = Counter("geex_cache_expirations_total", "Entries dropped from the response cache after their TTL.")
+CACHE_EXPIRATIONS.set_function(lambda: response_cache.expirations if response_cache else 0)
+CACHE_ENTRIES = Gauge("geex_cache_entries", "Entries currently held in the response cache.")
+CACHE_ENTRIES.set_function(lambda: len(response_cache) if response_cache else 0)
+HISTORY_CHARS_SAVED = Histogram("geex_history_chars_saved", "History characters removed by compaction per request.",
+                                buckets=DEFAULT_SIZE_BUCKETS)
+HISTORY_PAIRS_DROPPED = Counter("geex_history_pairs_dropped_total", "History pairs dropped by compaction.")
+ABANDONED = Counter("geex_abandoned_requests_total", "Requests whose client disconnected before completion.", ["stream"])
+
 
 # Pydantic Models
 class ChatMessage(BaseModel):
@@ -93,6 +165,136 @@ class StreamResponse(BaseModel):
     choices: List[StreamChoice]
 
 
+def _detect_json_string_encoder():
+    """Find the stdlib string escaper that matches the installed pydantic's JSON output."""
+    probe = "\u00e9\"\\\n\x01/\u2028"
+    rendered = StreamChoice(delta={"content": probe}).json()
+    for encoder in (encode_basestring, encode_basestring_ascii):
+        if encoder(probe) in rendered:
+            return encoder
+    return None
+
+
+_json_string_encoder = _detect_json_string_encoder()
+_DELTA_SENTINEL = "__codegeex_delta__"
+
+
+class StreamChunkEncoder:
+    """Encode OpenAI stream chunks for one stream.
+
+    id/created/model are rendered once into a byte template; each content
+    delta only needs its text JSON-escaped. The output is byte-identical to
+    StreamResponse(...).json().
+    """
+
+    def __init__(self, model: str, stream_id: Optional[str] = None, created: Optional[int] = None):
+        self.model = model
+        self.stream_id = stream_id or f"chatcmpl-{uuid.uuid4().hex}"
+        self.created = created if created is not None else int(time.time())
+
+        quoted_sentinel = f'"{_DELTA_SENTINEL}"'
+        prefix, suffix = self._render({"content": _DELTA_SENTINEL}).split(quoted_sentinel)
+        self._content_prefix = f"data: {prefix}".encode("utf-8")
+        self._content_suffix = f"{suffix}\n\n".encode("utf-8")
+
+    def _render(self, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+        return StreamResponse(
+            id=self.stream_id,
+            created=self.created,
+            model=self.model,
+            choices=[StreamChoice(delta=delta, finish_reason=finish_reason)],
+        ).json()
+
+    def role(self) -> bytes:
+        return f"data: {self._render({'role': 'assistant'})}\n\n".encode("utf-8")
+
+    def content(self, text: str) -> bytes:
+        if _json_string_encoder is None:
+            return f"data: {self._render({'content': text})}\n\n".encode("utf-8")
+        return self._content_prefix + _json_string_encoder(text).encode("utf-8") + self._content_suffix
+
+    def finish(self) -> bytes:
+        return f"data: {self._render({}, finish_reason='stop')}\n\n".encode("utf-8")
+
+
+class RequestTrace:
+    """Per-request timing and size bookkeeping feeding the metrics above."""
+
+    __slots__ = ("model", "stream", "start", "upstream_start", "first_byte_seen",
+                 "first_delta_seen", "bytes", "events", "finished", "permit")
+
+    def __init__(self, model: str, stream: bool):
+        # 未知模型统一归为 unknown，避免标签基数失控
+        self.model = model if model in CODEGEEX_MODELS else "unknown"
+        self.stream = "true" if stream else "false"
+        self.start = time.perf_counter()
+        self.upstream_start = self.start
+        self.first_byte_seen = False
+        self.first_delta_seen = False
+        self.bytes = 0
+        self.events = 0
+        self.finished = False
+        self.permit = None
+        REQUESTS_IN_FLIGHT.labels(self.stream).inc()
+
+    def upstream_sent(self):
+        self.upstream_start = time.perf_counter()
+        self.first_byte_seen = False
+
+    def upstream_headers(self, status_code: int):
+        UPSTREAM_LATENCY.observe(time.perf_counter() - self.upstream_start)
+        UPSTREAM_RESPONSES.labels(status_code).inc()
+
+    def chunk(self, size: int):
+        if not self.first_byte_seen:
+            self.first_byte_seen = True
+            UPSTREAM_TTFB.observe(time.perf_counter() - self.upstream_start)
+        self.bytes += size
+
+    def delta(self):
+        if not self.first_delta_seen:
+            self.first_delta_seen = True
+            FIRST_DELTA.labels(self.model).observe(time.perf_counter() - self.start)
+
+    def finish(self, status_code: int):
+        if self.finished:
+            return
+        self.finished = True
+        if self.permit is not None:
+            self.permit.release()
+        REQUESTS_IN_FLIGHT.labels(self.stream).dec()
+        REQUESTS_TOTAL.labels(self.model, status_code).inc()
+        REQUEST_DURATION.labels(self.model, self.stream).observe(time.perf_counter() - self.start)
+        if self.first_byte_seen:
+            STREAM_BYTES.observe(self.bytes)
+            STREAM_EVENTS.observe(self.events)
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client goes away while a request is still being served."""
+
+
+class UpstreamStreamingResponse(StreamingResponse):
+    """StreamingResponse that always finalizes its body generator.
+
+    On servers that report disconnects by failing send() (ASGI spec 2.4) the
+    generator would otherwise stay suspended at a yield, holding the upstream
+    connection, until garbage collection.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+
+async def _close_upstream(response: httpx.Response):
+    """Close the upstream response even inside a cancelled scope."""
+    with anyio.CancelScope(shield=True):
+        await response.aclose()
+
+
 # FastAPI App
 app = FastAPI(title="CodeGeeX OpenAI API Adapter")
 security = HTTPBearer(auto_error=False)
@@ -169,32 +371,38 @@ def get_best_codegeex_token() -> Optional[CodeGeeXToken]:
         return token
 
 
+def _text_content(msg: ChatMessage) -> str:
+    return msg.content if isinstance(msg.content, str) else ""
+
+
 def _convert_messages_to_codegeex_format(messages: List[ChatMessage]):
     """Convert OpenAI messages format to CodeGeeX prompt and history format."""
     if not messages:
         return "", []
 
     # Extract the last user message as prompt
-    last_user_msg = None
-    for msg in reversed(messages):
-        if msg.role == "user":
-            last_user_msg = msg
+    last_user_idx = None
+    for idx in range(len(messages) - 1, -1, -1):
+        if messages[idx].role == "user":
+            last_user_idx = idx
             break
 
-    if not last_user_msg:
+    if last_user_idx is None:
         raise HTTPException(status_code=400, detail="No user message found in the conversation.")
 
-    prompt = last_user_msg.content if isinstance(last_user_msg.content, str) else ""
+    prompt = _text_content(messages[last_user_idx])
 
     # Build history from previous messages (excluding the last user message)
     history = []
     user_content = ""
     assistant_content = ""
 
-    for i, msg in enumerate(messages[:-1] if messages[-1].role == "user" else messages):
-        if msg == last_user_msg:
+    end = len(messages) - 1 if messages[-1].role == "user" else len(messages)
+    for idx in range(end):
+        if idx == last_user_idx:
             continue
 
+        msg = messages[idx]
         if msg.role == "user":
             # If we have a complete pair, add it to history
             if user_content and assistant_content:
@@ -207,12 +415,10 @@ def _convert_messages_to_codegeex_format(messages: List[ChatMessage]):
                 assistant_content = ""
 
             # Start a new pair with this user message
-            content = msg.content if isinstance(msg.content, str) else ""
-            user_content = content
+            user_content = _text_content(msg)
 
         elif msg.role == "assistant":
-            content = msg.content if isinstance(msg.content, str) else ""
-            assistant_content = content
+            assistant_content = _text_content(msg)
 
             # If we have a complete pair, add it to history
             if user_content:
@@ -232,17 +438,63 @@ def _convert_messages_to_codegeex_format(messages: List[ChatMessage]):
     return prompt, history
 
 
+def _truncate_pair(pair: Dict[str, str], budget: int) -> Dict[str, str]:
+    """Shrink a history pair to `budget` characters, keeping the start of each side."""
+    query, answer = pair["query"], pair["answer"]
+    query_budget = min(len(query), max(budget // 2, budget - len(answer)))
+    answer_budget = budget - query_budget
+    marker = "\n...[truncated]"
+    if len(query) > query_budget:
+        query = query[:max(query_budget - len(marker), 0)] + marker
+    if len(answer) > answer_budget:
+        answer = answer[:max(answer_budget - len(marker), 0)] + marker
+    return {"query": query, "answer": answer, "id": pair["id"]}
+
+
+def _compact_history(history: List[Dict[str, str]], budget: int):
+    """Keep the newest history pairs within `budget` characters.
+
+    The pair straddling the budget is truncated if enough room is left,
+    older pairs are dropped. Returns (history, chars_saved, pairs_dropped).
+    """
+    if budget <= 0 or not history:
+        return history, 0, 0
+
+    kept = []
+    remaining = budget
+    total = 0
+    for pair in reversed(history):
+        size = len(pair["query"]) + len(pair["answer"])
+        total += size
+        if remaining <= 0:
+            continue
+        if size <= remaining:
+            kept.append(pair)
+            remaining -= size
+        elif remaining >= HISTORY_MIN_TRUNCATED_CHARS:
+            kept.append(_truncate_pair(pair, remaining))
+            remaining = 0
+        else:
+            remaining = 0
+
+    kept.reverse()
+    kept_size = sum(len(pair["query"]) + len(pair["answer"]) for pair in kept)
+    return kept, total - kept_size, len(history) - len(kept)
+
+
 async def authenticate_client(
         auth: Optional[HTTPAuthorizationCredentials] = Depends(security),
-):
-    """Authenticate client based on API key in Authorization header"""
+) -> str:
+    """Authenticate client based on API key in Authorization header; returns the key"""
     if not VALID_CLIENT_KEYS:
+        AUTH_FAILURES.labels(503).inc()
         raise HTTPException(
             status_code=503,
             detail="Service unavailable: Client API keys not configured on server.",
         )
 
     if not auth or not auth.credentials:
+        AUTH_FAILURES.labels(401).inc()
         raise HTTPException(
             status_code=401,
             detail="API key required in Authorization header.",
@@ -250,18 +502,56 @@ async def authenticate_client(
         )
 
     if auth.credentials not in VALID_CLIENT_KEYS:
+        AUTH_FAILURES.labels(403).inc()
         raise HTTPException(status_code=403, detail="Invalid client API key.")
 
+    return auth.credentials
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (pip install httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_upstream_client() -> httpx.AsyncClient:
+    """Create the pooled keep-alive client used for all CodeGeeX calls."""
+    http2 = _http2_available()
+    log_debug(f"Creating upstream client (http2={http2}, max_connections={UPSTREAM_MAX_CONNECTIONS})")
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        ),
+        timeout=httpx.Timeout(UPSTREAM_READ_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+    )
+
 
 @app.on_event("startup")
 async def startup():
     """应用启动时初始化配置"""
+    global upstream_client
     print("Starting CodeGeeX OpenAI API Adapter server...")
     load_client_api_keys()
     load_codegeex_tokens()
+    upstream_client = create_upstream_client()
     print("Server initialization completed.")
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    """应用关闭时释放上游连接池"""
+    global upstream_client
+    if upstream_client is not None:
+        await upstream_client.aclose()
+        upstream_client = None
+    print("Upstream client closed.")
+
+
 def get_models_list_response() -> ModelList:
     """Helper to construct ModelList response from cached models."""
     model_infos = [
@@ -276,7 +566,7 @@ def get_models_list_response() -> ModelList:
 
 
 @app.get("/v1/models", response_model=ModelList)
-async def list_v1_models(_: None = Depends(authenticate_client)):
+async def list_v1_models(_: str = Depends(authenticate_client)):
     """List available models - authenticated"""
     return get_models_list_response()
 
@@ -296,151 +586,108 @@ async def toggle_debug(enable: bool = Query(None)):
     return {"debug_mode": DEBUG_MODE}
 
 
-def _codegeex_stream_generator(response, model: str):
-    """Real-time streaming with format conversion - CodeGeeX to OpenAI"""
-    stream_id = f"chatcmpl-{uuid.uuid4().hex}"
-    created_time = int(time.time())
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus 文本格式指标"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def _counted_bytes(response: httpx.Response, trace: RequestTrace):
+    async for chunk in response.aiter_bytes():
+        trace.chunk(len(chunk))
+        yield chunk
+
+
+async def _iter_codegeex_events(response: httpx.Response, trace: RequestTrace):
+    """Decode the upstream SSE body into (event_type, data_json) pairs."""
+    async for event in aiter_sse(_counted_bytes(response, trace)):
+        trace.events += 1
+        if not event.event or not event.data:
+            continue
+        try:
+            data_json = json.loads(event.data)
+        except json.JSONDecodeError:
+            log_debug(f"Failed to parse JSON: {event.data}")
+            continue
+        if not data_json:
+            continue
+        yield event.event, data_json
 
-    # 发送初始角色增量
-    yield f"data: {StreamResponse(id=stream_id, created=created_time, model=model, choices=[StreamChoice(delta={'role': 'assistant'})]).json()}\n\n"
 
-    buffer = ""
+async def _codegeex_stream_generator(response: httpx.Response, model: str, trace: RequestTrace,
+                                     encoder: Optional[StreamChunkEncoder] = None):
+    """Real-time streaming with format conversion - CodeGeeX to OpenAI"""
+    encoder = encoder or StreamChunkEncoder(model)
+    status_code = 200
 
     try:
-        for chunk in response.iter_content(chunk_size=1024):
-            if not chunk:
-                continue
-
-            chunk_text = chunk.decode("utf-8")
-            log_debug(f"Received chunk: {chunk_text[:100]}..." if len(chunk_text) > 100 else chunk_text)
-            buffer += chunk_text
-
-            # 处理缓冲区中的完整事件块
-            while "\n\n" in buffer:
-                event_data, buffer = buffer.split("\n\n", 1)
-                event_data = event_data.strip()
-
-                if not event_data:
-                    continue
-
-                # 解析事件
-                event_type = None
-                data_json = None
-
-                for line in event_data.split("\n"):
-                    line = line.strip()
-                    if line.startswith("event:"):
-                        event_type = line[6:].strip()
-                    elif line.startswith("data:"):
-                        try:
-                            data_json = json.loads(line[5:].strip())
-                        except json.JSONDecodeError:
-                            log_debug(f"Failed to parse JSON: {line[5:].strip()}")
-
-                if not event_type or not data_json:
-                    continue
-
-                if event_type == "add":
-                    # 'text' 字段本身就是增量内容
-                    delta = data_json.get("text", "")
-                    if delta:
-                        openai_response = StreamResponse(
-                            id=stream_id,
-                            created=created_time,
-                            model=model,
-                            choices=[StreamChoice(delta={"content": delta})],
-                        )
-                        yield f"data: {openai_response.json()}\n\n"
-
-                elif event_type == "finish":
-                    # 'finish' 事件标志着流的结束
-                    log_debug("Received finish event.")
-                    openai_response = StreamResponse(
-                        id=stream_id,
-                        created=created_time,
-                        model=model,
-                        choices=[StreamChoice(delta={}, finish_reason="stop")],
-                    )
-                    yield f"data: {openai_response.json()}\n\n"
-                    yield "data: [DONE]\n\n"
-                    return # 终止生成器
+        # 发送初始角色增量
+        yield encoder.role()
+
+        async for event_type, data_json in _iter_codegeex_events(response, trace):
+            if event_type == "add":
+                # 'text' 字段本身就是增量内容
+                delta = data_json.get("text", "")
+                if delta:
+                    trace.delta()
+                    yield encoder.content(delta)
 
+            elif event_type == "finish":
+                # 'finish' 事件标志着流的结束
+                log_debug("Received finish event.")
+                yield encoder.finish()
+                yield "data: [DONE]\n\n"
+                return # 终止生成器
+
+    except (asyncio.CancelledError, GeneratorExit):
+        # 客户端断开：立即关闭上游连接，不再等待 CodeGeeX 生成完毕
+        log_debug("Client disconnected, closing upstream stream.")
+        status_code = CLIENT_CLOSED_REQUEST
+        ABANDONED.labels("true").inc()
+        raise
     except Exception as e:
         log_debug(f"Stream processing error: {e}")
         yield f"data: {json.dumps({'error': str(e)})}\n\n"
+    finally:
+        await _close_upstream(response)
+        trace.finish(status_code)
 
     # 如果流意外中断，也发送终止信号
     log_debug("Stream finished unexpectedly, sending completion signal.")
-    yield f"data: {StreamResponse(id=stream_id, created=created_time, model=model, choices=[StreamChoice(delta={}, finish_reason='stop')]).json()}\n\n"
+    yield encoder.finish()
     yield "data: [DONE]\n\n"
 
 
-def _build_codegeex_non_stream_response(response, model: str) -> ChatCompletionResponse:
+async def _build_codegeex_non_stream_response(response: httpx.Response, model: str,
+                                              trace: RequestTrace) -> ChatCompletionResponse:
     """Build non-streaming response by accumulating stream data."""
-    full_content = ""
-    buffer = ""
-
-    for chunk in response.iter_content(chunk_size=1024):
-        if not chunk:
-            continue
-
-        buffer += chunk.decode("utf-8")
-
-        # 处理缓冲区中的完整事件块
-        while "\n\n" in buffer:
-            event_data, buffer = buffer.split("\n\n", 1)
-            event_data = event_data.strip()
-
-            if not event_data:
-                continue
-
-            # 解析事件
-            event_type = None
-            data_json = None
-
-            for line in event_data.split("\n"):
-                line = line.strip()
-                if line.startswith("event:"):
-                    event_type = line[6:].strip()
-                elif line.startswith("data:"):
-                    try:
-                        data_json = json.loads(line[5:].strip())
-                    except json.JSONDecodeError:
-                        continue
-
-            if not event_type or not data_json:
-                continue
+    parts = []
 
+    try:
+        async for event_type, data_json in _iter_codegeex_events(response, trace):
             if event_type == "add":
                 # 正确地累积增量文本
-                full_content += data_json.get("text", "")
+                trace.delta()
+                parts.append(data_json.get("text", ""))
 
             elif event_type == "finish":
                 # finish事件中的text是最终的完整文本，以此为准
                 finish_text = data_json.get("text", "")
                 if finish_text:
-                    full_content = finish_text
+                    parts = [finish_text]
                 # 收到finish事件，可以提前结束解析
-                return ChatCompletionResponse(
-                    model=model,
-                    choices=[
-                        ChatCompletionChoice(
-                            message=ChatMessage(
-                                role="assistant",
-                                content=full_content
-                            )
-                        )
-                    ],
-                )
+                break
+    finally:
+        await _close_upstream(response)
 
-    # 如果循环结束仍未返回（例如没有finish事件），则使用累积的内容
+    # 如果没有finish事件，则使用累积的内容
     return ChatCompletionResponse(
         model=model,
         choices=[
             ChatCompletionChoice(
                 message=ChatMessage(
                     role="assistant",
-                    content=full_content
+                    content="".join(parts)
                 )
             )
         ],
@@ -449,9 +696,111 @@ def _build_codegeex_non_stream_response(response, model: str) -> ChatCompletionR
 
 @app.post("/v1/chat/completions")
 async def chat_completions(
-        request: ChatCompletionRequest, _: None = Depends(authenticate_client)
+        request: ChatCompletionRequest, raw_request: Request, client_key: str = Depends(authenticate_client)
 ):
     """Create chat completion using CodeGeeX backend"""
+    trace = RequestTrace(request.model, request.stream)
+    use_cache = response_cache is not None and not request.stream
+    if use_cache and _cache_bypassed(raw_request):
+        CACHE_REQUESTS.labels("bypass").inc()
+        use_cache = False
+    try:
+        result = await _run_until_disconnect(
+            raw_request, _create_chat_completion(request, trace, client_key, use_cache)
+        )
+    except ClientDisconnected:
+        log_debug("Client disconnected before the response was ready.")
+        ABANDONED.labels(trace.stream).inc()
+        trace.finish(CLIENT_CLOSED_REQUEST)
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except HTTPException as e:
+        trace.finish(e.status_code)
+        raise
+    except BaseException:
+        trace.finish(500)
+        raise
+
+    # 流式响应在生成器结束时记录
+    if not isinstance(result, StreamingResponse):
+        trace.finish(200)
+    return result
+
+
+async def _run_until_disconnect(raw_request: Request, coro):
+    """Await coro, cancelling it (and its upstream call) if the client disconnects first."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await raw_request.is_disconnected():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _cache_bypassed(raw_request: Request) -> bool:
+    """X-Cache-Bypass: true or Cache-Control: no-cache/no-store skips the response cache."""
+    if raw_request.headers.get(CACHE_BYPASS_HEADER, "").lower() in ("1", "true", "yes"):
+        return True
+    cache_control = raw_request.headers.get("cache-control", "").lower()
+    return "no-cache" in cache_control or "no-store" in cache_control
+
+
+def _request_cache_key(request: ChatCompletionRequest) -> str:
+    """Canonical hash of everything that affects a non-stream completion."""
+    canonical = json.dumps(
+        request.dict(exclude={"stream"}), sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+async def _acquire_slot(client_key: str) -> Permit:
+    """Wait for an admission slot, turning rejections into 429/503 responses."""
+    try:
+        permit = await admission.acquire(client_key)
+    except AdmissionRejected as e:
+        ADMISSION_REJECTED.labels(e.reason).inc()
+        if e.reason == "queue_full":
+            detail = "Too many requests queued, please retry later."
+            status_code = 429
+        else:
+            detail = "Timed out waiting for a free slot, please retry later."
+            status_code = 503
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(e.retry_after)})
+    ADMISSION_WAIT.observe(permit.wait_time)
+    return permit
+
+
+async def _cached_completion(request: ChatCompletionRequest, prompt: str, history: List[Dict[str, str]],
+                             trace: RequestTrace, client_key: str) -> ChatCompletionResponse:
+    """Serve a non-stream completion from cache, or share one upstream call per key."""
+    key = _request_cache_key(request)
+    cached = response_cache.get(key)
+    if cached is not None:
+        CACHE_REQUESTS.labels("hit").inc()
+        return cached
+
+    async def fetch():
+        permit = await _acquire_slot(client_key)
+        try:
+            result = await _call_codegeex(request, prompt, history, trace)
+        finally:
+            permit.release()
+        response_cache.put(key, result)
+        return result
+
+    result, shared = await inflight_requests.do(key, fetch)
+    CACHE_REQUESTS.labels("coalesced" if shared else "miss").inc()
+    return result
+
+
+async def _create_chat_completion(request: ChatCompletionRequest, trace: RequestTrace, client_key: str,
+                                  use_cache: bool = False):
     if request.model not in CODEGEEX_MODELS:
         raise HTTPException(status_code=404, detail=f"Model '{request.model}' not found.")
 
@@ -466,6 +815,23 @@ async def chat_completions(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to process messages: {str(e)}")
 
+    history, chars_saved, pairs_dropped = _compact_history(history, HISTORY_CHAR_BUDGET)
+    if chars_saved:
+        HISTORY_CHARS_SAVED.observe(chars_saved)
+        HISTORY_PAIRS_DROPPED.inc(pairs_dropped)
+        log_debug(f"History compacted: saved {chars_saved} chars, dropped {pairs_dropped} pairs, kept {len(history)}")
+
+    if use_cache:
+        return await _cached_completion(request, prompt, history, trace, client_key)
+
+    # 准入控制：名额在 trace.finish() 时归还（流式响应即流结束时）
+    trace.permit = await _acquire_slot(client_key)
+    return await _call_codegeex(request, prompt, history, trace)
+
+
+async def _call_codegeex(request: ChatCompletionRequest, prompt: str, history: List[Dict[str, str]],
+                         trace: RequestTrace):
+    """Send the request upstream, rotating through CodeGeeX tokens on failure."""
     # 尝试所有令牌
     for attempt in range(len(CODEGEEX_TOKENS) + 1):  # +1 to handle the case of no tokens
         if attempt == len(CODEGEEX_TOKENS):
@@ -512,19 +878,25 @@ async def chat_completions(
 
             log_debug(f"Sending request to CodeGeeX API with token ending in ...{token['token'][-4:]}")
 
-            response = requests.post(
-                "https://codegeex.cn/prod/code/chatCodeSseV3/chat",
-                data=json.dumps(payload),
+            upstream_request = upstream_client.build_request(
+                "POST",
+                CODEGEEX_API_URL,
+                content=json.dumps(payload),
                 headers=headers,
-                stream=True,
-                timeout=300.0,
             )
+            trace.upstream_sent()
+            response = await upstream_client.send(upstream_request, stream=True)
+            trace.upstream_headers(response.status_code)
+            if response.is_error:
+                # 读取错误响应体后归还连接
+                await response.aread()
+                await response.aclose()
             response.raise_for_status()
 
             if request.stream:
                 log_debug("Returning stream response")
-                return StreamingResponse(
-                    _codegeex_stream_generator(response, request.model),
+                return UpstreamStreamingResponse(
+                    _codegeex_stream_generator(response, request.model, trace),
                     media_type="text/event-stream",
                     headers={
                         "Cache-Control": "no-cache",
@@ -534,9 +906,9 @@ async def chat_completions(
                 )
             else:
                 log_debug("Building non-stream response")
-                return _build_codegeex_non_stream_response(response, request.model)
+                return await _build_codegeex_non_stream_response(response, request.model, trace)
 
-        except requests.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             status_code = getattr(e.response, "status_code", 500)
             error_detail = getattr(e.response, "text", str(e))
             log_debug(f"CodeGeeX API error ({status_code}): {error_detail}")
@@ -594,6 +966,11 @@ if __name__ == "__main__":
     print("  GET  /models (No Auth)")
     print("  POST /v1/chat/completions (Client API Key Auth)")
     print("  GET  /debug?enable=[true|false] (Toggle Debug Mode)")
+    print("  GET  /metrics (Prometheus Metrics)")
+    print(f"Admission: max_concurrent={ADMISSION_MAX_CONCURRENT}, max_queue={ADMISSION_MAX_QUEUE}, "
+          f"queue_timeout={ADMISSION_QUEUE_TIMEOUT}s")
+    if response_cache is not None:
+        print(f"Response cache: size={RESPONSE_CACHE_SIZE}, ttl={RESPONSE_CACHE_TTL}s")
 
     print(f"\nClient API Keys: {len(VALID_CLIENT_KEYS)}")
     if CODEGEEX_TOKENS:
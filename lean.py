@@ -0,0 +1,91 @@
+"""Opt-in lean resource profile: block heavy subresources via CDP Fetch.
+
+Requests matching the blocked resource types or URL patterns are paused at
+the request stage, before anything is sent to the server. Unless their URL
+matches the allowlist they are then failed with BlockedByClient, so neither
+a connection nor a download happens for them. Only matching requests are
+paused at all; everything else loads untouched.
+"""
+import fnmatch
+import os
+from collections import Counter
+
+from pydoll.commands import FetchCommands
+from pydoll.constants import NetworkErrorReason
+from pydoll.protocol.fetch.events import FetchEvent
+
+from cdp_session import session_for
+
+DEFAULT_BLOCK_TYPES = "Image,Media,Font"
+DEFAULT_BLOCK_PATTERNS = "*youtube.com/embed/*,*player.bilibili.com/*,*googletagmanager.com/*,*google-analytics.com/*"
+# Cloudflare 验证页需要的资源不能拦截
+DEFAULT_ALLOW_PATTERNS = "*challenges.cloudflare.com/*"
+
+
+def split_list(value: str):
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+class LeanProfile:
+    """Fetch-interception rules plus per-run counters of what was blocked."""
+
+    def __init__(self, block_types, block_patterns, allow_patterns):
+        self.block_types = list(block_types)
+        self.block_patterns = list(block_patterns)
+        self.allow_patterns = list(allow_patterns)
+        self.blocked = Counter()
+        self.allowed = 0
+        self._attached = set()
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from env vars / config.ini [settings]; returns None unless lean mode is on."""
+        enabled = os.getenv("LEAN_MODE", config.get('settings', 'lean_mode', fallback='false'))
+        if enabled.lower() != 'true':
+            return None
+        return cls(
+            split_list(os.getenv("LEAN_BLOCK_TYPES", config.get('settings', 'lean_block_types', fallback=DEFAULT_BLOCK_TYPES))),
+            split_list(os.getenv("LEAN_BLOCK_PATTERNS", config.get('settings', 'lean_block_patterns', fallback=DEFAULT_BLOCK_PATTERNS))),
+            split_list(os.getenv("LEAN_ALLOW_PATTERNS", config.get('settings', 'lean_allow_patterns', fallback=DEFAULT_ALLOW_PATTERNS))),
+        )
+
+    def _patterns(self):
+        patterns = [{"urlPattern": "*", "resourceType": kind, "requestStage": "Request"} for kind in self.block_types]
+        patterns += [{"urlPattern": pattern, "requestStage": "Request"} for pattern in self.block_patterns]
+        return patterns
+
+    def is_allowed(self, url: str) -> bool:
+        return any(fnmatch.fnmatchcase(url, pattern) for pattern in self.allow_patterns)
+
+    async def attach(self, tab):
+        """Start intercepting on a tab; calling it again for the same tab is a no-op."""
+        if tab._target_id in self._attached:
+            return
+        session = session_for(tab)
+
+        async def on_paused(event):
+            params = event["params"]
+            request_id = params["requestId"]
+            url = params["request"]["url"]
+            # 允许列表中的请求照常放行
+            if self.is_allowed(url):
+                self.allowed += 1
+                await session.execute(FetchCommands.continue_request(request_id))
+                return
+            self.blocked[params.get("resourceType", "Other")] += 1
+            await session.execute(FetchCommands.fail_request(request_id, NetworkErrorReason.BLOCKED_BY_CLIENT))
+
+        await tab.on(FetchEvent.REQUEST_PAUSED, on_paused)
+        # FetchCommands.enable 只支持单个匹配规则，这里直接组装命令
+        command = {"method": "Fetch.enable", "params": {"patterns": self._patterns()}}
+        await session.execute(command)
+        # 新连接上 Fetch 域是关闭的，重连后要带着同样的规则重新开启
+        session.keep_enabled(command)
+        self._attached.add(tab._target_id)
+
+    def summary(self) -> dict:
+        return {
+            "blocked": sum(self.blocked.values()),
+            "by type": ", ".join(f"{kind}={count}" for kind, count in self.blocked.most_common()) or "-",
+            "allowed": self.allowed,
+        }
@@ -0,0 +1,85 @@
+"""Per-topic performance metrics and a memory watchdog for the topic pipeline.
+
+The engine's page_metrics() reads Performance.getMetrics on a page and keeps
+the JS heap, DOM node count and cumulative layout/script time (METRIC_NAMES).
+The pipeline samples a page before and after each topic. TopicSample then
+holds the heap and nodes at the end and the layout/script time spent on the
+topic, together with the browser's RSS from proc_stats.
+
+Watchdog compares every sample with the configured ceilings. It asks for a
+new tab when the page's heap or node count is too high, and for a browser
+restart when the whole browser process tree is over its RSS limit.
+"""
+import logging
+import os
+from typing import NamedTuple, Optional
+
+WATCHDOG_TAB_HEAP_MB = float(os.getenv("WATCHDOG_TAB_HEAP_MB", "256"))
+WATCHDOG_TAB_NODES = int(os.getenv("WATCHDOG_TAB_NODES", "60000"))
+WATCHDOG_BROWSER_RSS_MB = float(os.getenv("WATCHDOG_BROWSER_RSS_MB", "2048"))
+WATCHDOG_MAX_BROWSER_RESTARTS = int(os.getenv("WATCHDOG_MAX_BROWSER_RESTARTS", "2"))
+
+METRIC_NAMES = ("JSHeapUsedSize", "Nodes", "LayoutDuration", "ScriptDuration")
+
+TAB = "tab"
+BROWSER = "browser"
+
+
+class TopicSample(NamedTuple):
+    heap: float = 0.0
+    nodes: int = 0
+    layout: float = 0.0
+    script: float = 0.0
+    rss: int = 0
+    renderer: int = 0
+
+    @classmethod
+    def between(cls, before: dict, after: dict, memory: dict) -> "TopicSample":
+        def spent(name):
+            # 计数在新渲染进程里会从 0 重新开始，此时直接用结束时的值
+            value = after.get(name, 0.0) - before.get(name, 0.0)
+            return value if value >= 0 else after.get(name, 0.0)
+
+        return cls(after.get("JSHeapUsedSize", 0.0), int(after.get("Nodes", 0)), spent("LayoutDuration"),
+                   spent("ScriptDuration"), memory.get("total", 0), memory.get("renderer", 0))
+
+    def row(self) -> dict:
+        return {
+            "heap MB": round(self.heap / 1024 / 1024, 1),
+            "nodes": self.nodes,
+            "layout ms": round(self.layout * 1000),
+            "script ms": round(self.script * 1000),
+            "rss MB": round(self.rss / 1024 / 1024),
+            "renderer MB": round(self.renderer / 1024 / 1024),
+        }
+
+
+class Watchdog:
+    """Decides after each topic whether the tab or the whole browser should be recycled."""
+
+    def __init__(self, tab_heap_mb: float = WATCHDOG_TAB_HEAP_MB, tab_nodes: int = WATCHDOG_TAB_NODES,
+                 browser_rss_mb: float = WATCHDOG_BROWSER_RSS_MB):
+        self.tab_heap = tab_heap_mb * 1024 * 1024
+        self.tab_nodes = tab_nodes
+        self.browser_rss = browser_rss_mb * 1024 * 1024
+        self.tab_recycles = 0
+        self.browser_recycles = 0
+
+    def check(self, sample: TopicSample) -> Optional[str]:
+        """TAB, BROWSER or None."""
+        if self.browser_rss and sample.rss > self.browser_rss:
+            self.browser_recycles += 1
+            logging.warning(f"看门狗：浏览器内存 {sample.rss / 1024 / 1024:.0f} MB 超过上限，重启浏览器")
+            return BROWSER
+        if self.tab_heap and sample.heap > self.tab_heap:
+            self.tab_recycles += 1
+            logging.warning(f"看门狗：页面 JS 堆 {sample.heap / 1024 / 1024:.0f} MB 超过上限，更换标签页")
+            return TAB
+        if self.tab_nodes and sample.nodes > self.tab_nodes:
+            self.tab_recycles += 1
+            logging.warning(f"看门狗：页面 DOM 节点 {sample.nodes} 个超过上限，更换标签页")
+            return TAB
+        return None
+
+    def summary(self) -> dict:
+        return {"tab recycles": self.tab_recycles, "browser recycles": self.browser_recycles}
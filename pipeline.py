@@ -0,0 +1,439 @@
+"""The forum pipeline shared by main.py (pydoll) and ba-main.py (Playwright).
+
+run_pass() does one visit on a started engine (see engines.py):
+
+1. restore the saved session and open the home page;
+2. check the session, logging in again when needed;
+3. discover topics and read them, liking, replying and bookmarking by
+   probability.
+
+Around the topic loop run the seen index, the checkpoint, the deadline
+budgets, the tab pool and the memory watchdog. A performance fix made here
+therefore applies to both engines. The pipeline only uses the Engine
+methods. Anything specific to one browser library belongs in its backend.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+
+from tabulate import tabulate
+
+from deadline import DEADLINE, DISCOVERY_BUDGET, FIRST_NAVIGATION_BUDGET, LOGIN_BUDGET
+from discovery import TopicRecord, discover_topics
+from dom_extract import CONNECT_TABLE_ROWS, HIGHEST_POST_READ
+from engines import PAGE_LOAD_TIMEOUT, SELECTOR_TIMEOUT
+from perf_watchdog import BROWSER, TopicSample, Watchdog
+from run_record import RUN
+from run_state import RunCheckpoint, SeenIndex
+from session_store import SESSION_CHECK, SessionStore
+
+
+async def open_home(engine, page, home_url: str):
+    await engine.navigate(page, home_url, step="首页加载")
+    await engine.settle(page, step="首页请求")
+    # Cloudflare 验证通过后才会渲染 Discourse 主体
+    await engine.wait(page, "#main-outlet", timeout=60, step="首页渲染", raise_exc=False)
+
+
+async def login(engine, page, home_url: str, username: str, password: str) -> bool:
+    logging.info("尝试登录...")
+    try:
+        await engine.navigate(page, home_url.rstrip('/') + "/login", step="登录页加载")
+        await engine.settle(page, step="登录页请求")
+        await engine.wait(page, "#login-account-name", timeout=30, step="登录表单")
+        await engine.type_text(page, "#login-account-name", username)
+        await engine.type_text(page, "#login-account-password", password)
+        await engine.click(page, "#login-button")
+        # 等登录请求和随后的页面刷新结束，再检查用户菜单
+        await engine.settle(page, step="登录提交")
+        # 登录成功后页面头部会出现当前用户菜单
+        logged_in = await engine.wait(page, "#current-user", timeout=30, step="登录完成", raise_exc=False)
+        if not logged_in:
+            logging.error("登录失败，请检查账号密码及是否关闭二次认证")
+            return False
+        else:
+            logging.info("登录成功")
+            return True
+    except Exception as e:
+        logging.error(f"登录页面时出错: {e}")
+        screenshot_path = os.path.join(os.getcwd(), 'login.png')
+        await engine.screenshot(page, screenshot_path)
+        logging.info(f"Screenshot saved to: {screenshot_path}")
+        return False
+
+
+async def ensure_login(engine, page, session_store, restored, home_url, username, password) -> bool:
+    """Reuse the restored session if it is still valid, otherwise log in and save the new one."""
+    start = time.perf_counter()
+    if restored:
+        check = await engine.evaluate(page, SESSION_CHECK) or {}
+        if check.get("valid"):
+            logging.info(f"已恢复登录会话: {check.get('username')}")
+            session_store.record(True, time.perf_counter() - start)
+            return True
+        logging.info(f"保存的会话已失效（状态码 {check.get('status')}），重新登录")
+        session_store.clear()
+
+    start = time.perf_counter()
+    logged_in = await login(engine, page, home_url, username, password)
+    if logged_in:
+        session_store.save(await engine.export_session(home_url))
+        session_store.record(False, time.perf_counter() - start)
+    return logged_in
+
+
+async def visit_article_and_scroll(engine, page, go_done, max_seconds=None):
+    try:
+        # 随机滚动页面5到10秒，阅读主题时最多25到40秒，到底即提前结束
+        scroll_duration = random.randint(5, 10)
+        if go_done:
+            scroll_duration = random.randint(25, 40)
+        if max_seconds is not None:
+            # 时间预算不足时缩短滚动，至少滚动几秒
+            scroll_duration = max(3, min(scroll_duration, int(max_seconds)))
+        logging.info(f"随机滚动页面，最多 {scroll_duration} 秒...")
+
+        # 滚动由页面内的驱动脚本完成，只在结束时回报一次
+        report = await engine.scroll(page, scroll_duration)
+        logging.info(f"页面滚动完成: 原因 {report.get('reason')}，页面高度 {report.get('height')}，"
+                     f"滚动 {report.get('steps')} 次，用时 {report.get('elapsed', 0) / 1000:.1f} 秒")
+        return report
+
+    except Exception as e:
+        logging.error(f"滚动页面时出错: {e}")
+
+
+async def click_like(engine, page):
+    try:
+        if await engine.click(page, ".discourse-reactions-reaction-button button"):
+            logging.info("文章已点赞")
+        else:
+            logging.info("未找到点赞按钮")
+    except Exception as e:
+        logging.error(f"点赞操作失败: {e}")
+
+
+async def click_reply(engine, page):
+    try:
+        # 回复内容来自 config/reply_generator.py，需要时才导入
+        from config import reply_generator
+
+        random_message = await asyncio.to_thread(reply_generator.get_random_reply)
+        if not await engine.click(page, ".reply.create.btn-icon-text"):
+            logging.info("未找到回复按钮")
+            return None
+        logging.info("回复按钮已点击")
+
+        # 等待文本区域可见后键入回复内容
+        if not await engine.wait(page, ".d-editor-input", timeout=2, step="回复编辑框", raise_exc=False):
+            logging.warning("未找到回复文本框")
+            return None
+        await engine.type_text(page, ".d-editor-input", random_message, interval=0.05)
+        logging.info(f"回复内容: {random_message}")
+
+        await asyncio.sleep(2)
+        if not await engine.click(page, ".save-or-cancel .btn-primary.create"):
+            logging.warning("未找到提交按钮")
+            return None
+        logging.info("回复已提交")
+        return random_message  # 返回实际的回复内容
+
+    except Exception as e:
+        logging.error(f"回复操作失败: {e}")
+        return None
+
+
+async def click_collect(engine, page):
+    try:
+        if await engine.click(page, ".btn.bookmark-menu-trigger"):
+            logging.info("帖子已加入书签")
+        else:
+            logging.warning("未找到书签按钮")
+    except Exception as e:
+        logging.error(f"加入书签操作失败: {e}")
+
+
+def _resume_topics(resumed):
+    try:
+        return [TopicRecord(**topic) for topic in resumed]
+    except TypeError:
+        # 旧版本写下的检查点字段不同，丢弃后重新发现主题
+        logging.info("检查点格式已过时，重新获取主题列表")
+        return None
+
+
+async def read_topics(engine, page, settings) -> bool:
+    """Read the discovered topics; returns True when the watchdog wants the browser restarted."""
+    HOME_URL = settings["HOME_URL"]
+    seen = SeenIndex()
+    checkpoint = RunCheckpoint(engine.name)
+    pool = None
+    try:
+        logging.info("开始处理主题...")
+        logging.info(await engine.version())
+        # 上次运行中途退出时，接着处理检查点里剩下的主题
+        resumed = checkpoint.resume()
+        topics = _resume_topics(resumed) if resumed is not None else None
+        if topics is not None:
+            source = "检查点"
+        else:
+            # 加载主题：优先走 Discourse 的 JSON 接口，失败时回退到页面列表
+            with RUN.span("discovery"):
+                topics, source = await DEADLINE.run(
+                    "discovery", discover_topics(engine, page, HOME_URL, settings["MAX_TOPICS"]), DISCOVERY_BUDGET)
+            checkpoint.start([topic._asdict() for topic in topics])
+        total_topics = len(topics)
+        RUN.count("topics", total_topics)
+        logging.info(f"共找到 {total_topics} 个主题（来源 {source}）。")
+
+        skip_articles = []
+        skip_count = 0
+        browsed_articles = []
+        browsed_count = 0
+        liked_articles = []
+        like_count = 0
+        replied_articles = []
+        reply_count = 0
+        collected_articles = []
+        collect_count = 0
+
+        # 复用预热好的标签页依次打开主题，不再为每个主题新建、关闭页面
+        pool = engine.page_pool()
+        topic_metrics = []
+        # 每个主题结束后检查页面和浏览器内存，超限时更换标签页或重启浏览器
+        watchdog = Watchdog()
+        recycle_browser = False
+        stopped_early = False
+
+        for idx, topic in enumerate(topics):
+
+            article_title = topic.title
+
+            article_url = topic.url(HOME_URL)
+
+            if topic.pinned:
+                skip_articles.append({"title": article_title, "url": article_url})
+                skip_count += 1
+                RUN.count("skipped")
+                logging.info(f"跳过置顶的帖子：{article_title}")
+                checkpoint.advance(topic.id)
+                continue
+
+            if seen.is_read(topic.id, topic.highest_post):
+                skip_articles.append({"title": article_title, "url": article_url})
+                skip_count += 1
+                RUN.count("skipped")
+                seen.skipped += 1
+                logging.info(f"跳过已读完的帖子：{article_title}")
+                checkpoint.advance(topic.id)
+                continue
+
+            # 按剩余时间给这个主题分配预算，连最小预算都不够时提前结束
+            topic_budget = DEADLINE.plan_topic(len(topics) - idx)
+            if topic_budget is None:
+                stopped_early = True
+                RUN.count("deferred", len(topics) - idx)
+                logging.warning(f"距离截止时间不足，提前结束，剩余 {len(topics) - idx} 个主题留给下次运行")
+                break
+
+            logging.info(f"打开第 {idx + 1}/{len(topics)} 个主题 ：{article_url.strip()} ... ")
+
+            # 访问文章页面
+            budget = DEADLINE.soft("topic", topic_budget)
+            article_page = await pool.acquire()
+            broken = False
+            tti = None
+            verdict = None
+            before = await engine.page_metrics(article_page)
+
+            try:
+                load_start = time.perf_counter()
+                with RUN.span("topic.navigate", topic=topic.id):
+                    await engine.navigate(article_page, article_url, timeout=min(PAGE_LOAD_TIMEOUT, budget.left()),
+                                          step="主题页加载")
+                    if await engine.wait(article_page, ".topic-post",
+                                         timeout=min(SELECTOR_TIMEOUT, budget.left()), step="主题帖子",
+                                         raise_exc=False):
+                        # 可交互时间：从开始导航到第一个帖子渲染出来
+                        tti = time.perf_counter() - load_start
+
+                # 访问文章数累加
+                browsed_count += 1
+                RUN.count("browsed")
+                # 访问文章数信息记录
+                browsed_articles.append({"title": article_title, "url": article_url})
+                # 随机滚动页面
+                with RUN.span("topic.scroll", topic=topic.id):
+                    # 留几秒给点赞等后续操作
+                    await visit_article_and_scroll(engine, article_page, True, budget.left() - 5)
+                with RUN.span("topic.actions", topic=topic.id):
+                    # 记录读到的最大楼层，读完的主题下次运行不再打开
+                    try:
+                        seen.mark(topic.id, await engine.evaluate(article_page, HIGHEST_POST_READ) or 0)
+                    except RuntimeError as e:
+                        logging.warning(f"读取楼层号失败: {e}")
+                    if random.random() < settings["LIKE_PROBABILITY"]:
+                        await click_like(engine, article_page)
+                        liked_articles.append({"title": article_title, "url": article_url})
+                        like_count += 1
+                        RUN.count("liked")
+                    # 回复和加书签由入口脚本决定是否开启（ENABLE_ACTIONS）
+                    if settings["ENABLE_ACTIONS"] and random.random() < settings["REPLY_PROBABILITY"]:
+                        reply_message = await click_reply(engine, article_page)
+                        if reply_message:
+                            replied_articles.append(
+                                {"title": article_title, "url": article_url, "reply": reply_message})
+                            reply_count += 1
+                            RUN.count("replied")
+                    if settings["ENABLE_ACTIONS"] and random.random() < settings["COLLECT_PROBABILITY"]:
+                        await click_collect(engine, article_page)
+                        collected_articles.append({"title": article_title, "url": article_url})
+                        collect_count += 1
+                        RUN.count("collected")
+
+            except TimeoutError:
+                logging.warning(f"打开主题 ： {article_title} 超时，跳过该主题。")
+                RUN.count("timeouts")
+                # 超时的标签页可能卡在半加载状态，换一个新的
+                broken = True
+            finally:
+                after = await engine.page_metrics(article_page) if not broken else {}
+                memory = await engine.memory()
+                sample = TopicSample.between(before, after, memory)
+                verdict = watchdog.check(sample)
+                row = {"topic": topic.id, "TTI s": round(tti, 2) if tti is not None else "-", **sample.row()}
+                topic_metrics.append(row)
+                RUN.topic(row)
+                await pool.release(article_page, broken or verdict is not None)
+                checkpoint.advance(topic.id)
+                budget.end()
+                logging.info(f"已完成第 {idx + 1}/{len(topics)} 个主题 ： {article_title} ...")
+
+            if verdict == BROWSER:
+                recycle_browser = True
+                break
+
+        if recycle_browser:
+            # 保留检查点，重启浏览器后从这里继续
+            logging.info("看门狗要求重启浏览器，剩余主题在重启后继续处理")
+        elif stopped_early:
+            logging.info("已保留检查点，下次运行从剩余主题继续")
+        else:
+            # 全部处理完才删除检查点，中途出错时留给下次运行继续
+            checkpoint.finish()
+        logging.info(f"已读索引: {seen.summary()}")
+        if topic_metrics:
+            logging.info("--------------主题页可交互时间与性能指标-----------------")
+            logging.info("\n%s", tabulate(topic_metrics, headers="keys", tablefmt="pretty"))
+            logging.info(f"标签页池: {pool.summary()}，看门狗: {watchdog.summary()}")
+
+        # 打印跳过的文章信息
+        logging.info(f"一共跳过了 {skip_count} 篇文章。")
+        if skip_count > 0:
+            logging.info("--------------跳过的文章信息-----------------")
+            logging.info("\n%s",tabulate(skip_articles, headers="keys", tablefmt="pretty"))
+
+        # 打印浏览的文章信息
+        logging.info(f"一共浏览了 {browsed_count} 篇文章。")
+        if browsed_count > 0:
+            logging.info("--------------浏览的文章信息-----------------")
+            logging.info("\n%s",tabulate(browsed_articles, headers="keys", tablefmt="pretty"))
+
+        # 打印点赞的文章信息
+        logging.info(f"一共点赞了 {like_count} 篇文章。")
+        if like_count > 0:
+            logging.info("--------------点赞的文章信息-----------------")
+            logging.info("\n%s",tabulate(liked_articles, headers="keys", tablefmt="pretty"))
+
+        # 打印回复的文章信息
+        logging.info(f"一共回复了 {reply_count} 篇文章。")
+        if reply_count > 0:
+            logging.info("--------------回复的文章信息-----------------")
+            logging.info("\n%s",tabulate(replied_articles, headers="keys", tablefmt="pretty"))
+
+        # 打印加入书签的文章信息
+        logging.info(f"一共加入书签了 {collect_count} 篇文章。")
+        if collect_count > 0:
+            logging.info("--------------加入书签的文章信息-----------------")
+            logging.info("\n%s", tabulate(collected_articles, headers="keys", tablefmt="pretty"))
+
+        return recycle_browser
+
+    except Exception as e:
+        logging.error(f"处理主题时出错: {e}")
+    finally:
+        # 出错时也要关掉池里空闲的标签页
+        if pool is not None:
+            await pool.close()
+        seen.close()
+
+
+def session_store_for(engine, settings) -> SessionStore:
+    return SessionStore(engine.name, os.getenv("SESSION_SECRET") or settings["PASSWORD"])
+
+
+async def run_pass(engine, page, settings) -> bool:
+    """One pass over the forum on a started engine: restore session, log in, read topics.
+
+    Returns True when the watchdog stopped the pass early to have the browser restarted.
+    """
+    HOME_URL = settings["HOME_URL"]
+
+    # 首次导航前恢复保存的登录会话
+    session_store = session_store_for(engine, settings)
+    saved_session = session_store.load()
+    if saved_session:
+        await engine.restore_session(saved_session)
+
+    with RUN.span("first_navigation"):
+        await DEADLINE.run("first_navigation", open_home(engine, page, HOME_URL), FIRST_NAVIGATION_BUDGET)
+    screenshot_path = os.path.join(os.getcwd(), 'cap.png')
+    await engine.screenshot(page, screenshot_path)
+    logging.info(f"cap saved to: {screenshot_path}")
+
+    with RUN.span("login"):
+        logged_in = await DEADLINE.run(
+            "login", ensure_login(engine, page, session_store, bool(saved_session), HOME_URL,
+                                  settings["USERNAME"], settings["PASSWORD"]),
+            LOGIN_BUDGET)
+    if not logged_in:
+        return False
+
+    return await read_topics(engine, page, settings)
+
+
+async def print_connect_info(engine, page, connect_url: str):
+    try:
+        await engine.navigate(page, connect_url, step="connect 页加载")
+        await engine.wait(page, "table tr", timeout=10, step="connect 表格", raise_exc=False)
+        # 整张表一次取回，每行为 [项目, 当前, 要求, ...]
+        info = [cells[:3] for cells in await engine.evaluate(page, CONNECT_TABLE_ROWS) or []]
+
+        logging.info("--------------Connect Info 在过去 💯 天内-----------------")
+        logging.info("\n%s", tabulate(info, headers=["项目", "当前", "要求"], tablefmt="pretty"))
+    except TimeoutError:
+        logging.error("连接信息页面加载超时")
+    except Exception as e:
+        logging.error(f"打印连接信息时出错: {e}")
+
+
+async def logout(engine, page, settings):
+    """Log out of the forum and drop the saved session, which the logout invalidates."""
+    session_store_for(engine, settings).clear()
+    try:
+        await engine.navigate(page, settings["HOME_URL"], step="首页加载")
+        # 依次点开用户菜单、个人资料标签和退出按钮
+        for selector, name in (("#current-user .icon", "用户菜单按钮"), ("#user-menu-button-profile", "个人资料标签"),
+                               (".logout .btn", "退出按钮")):
+            logging.info(f"尝试找到并点击{name}...")
+            if not await engine.wait(page, selector, timeout=2, step=name, raise_exc=False) \
+                    or not await engine.click(page, selector):
+                logging.info(f"未找到{name}")
+                return
+            logging.info(f"成功点击{name}")
+    except TimeoutError:
+        logging.warning("定位按钮超时")
+    except Exception as e:
+        logging.error(f"操作失败: {e}")
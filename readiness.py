@@ -0,0 +1,186 @@
+"""Event-driven page readiness for pydoll tabs.
+
+Replaces fixed sleeps with waits on CDP events: the page load event, network
+idle (few in-flight requests for a quiet period) and a CSS selector showing
+up in the DOM. Every wait has its own timeout, logs how long it actually
+took, and is recorded so a run can print a per-step summary at the end.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+
+from pydoll.commands import PageCommands, RuntimeCommands
+from pydoll.protocol.network.events import NetworkEvent
+from pydoll.protocol.page.events import PageEvent
+
+from engines import (NETWORK_IDLE_MAX_INFLIGHT, NETWORK_IDLE_TIME, NETWORK_IDLE_TIMEOUT, PAGE_LOAD_TIMEOUT,
+                     SELECTOR_TIMEOUT)
+
+# 步骤名 -> [(耗时, 是否超时), ...]
+_wait_timings = defaultdict(list)
+
+_SELECTOR_SCRIPT = """new Promise((resolve) => {
+  const selector = %s;
+  if (document.querySelector(selector)) return resolve(true);
+  const observer = new MutationObserver(() => {
+    if (document.querySelector(selector)) { observer.disconnect(); resolve(true); }
+  });
+  observer.observe(document.documentElement, {childList: true, subtree: true});
+  setTimeout(() => { observer.disconnect(); resolve(false); }, %d);
+})"""
+
+
+class WaitTimeout(TimeoutError):
+    """A readiness wait ran past its timeout."""
+
+    def __init__(self, step: str, timeout: float):
+        super().__init__(f"{step} 等待超过 {timeout:.1f} 秒")
+        self.step = step
+        self.timeout = timeout
+
+
+def _record(step: str, start: float, timed_out: bool = False) -> float:
+    elapsed = time.perf_counter() - start
+    _wait_timings[step].append((elapsed, timed_out))
+    if timed_out:
+        logging.warning(f"等待 {step} 超时，已等待 {elapsed:.2f} 秒")
+    else:
+        logging.info(f"等待 {step} 完成，用时 {elapsed:.2f} 秒")
+    return elapsed
+
+
+def reset_waits():
+    _wait_timings.clear()
+
+
+def wait_summary():
+    """Per-step rows (count, timeouts, total/avg/max seconds) for tabulate."""
+    rows = []
+    for step, samples in _wait_timings.items():
+        durations = [elapsed for elapsed, _ in samples]
+        rows.append({
+            "step": step,
+            "count": len(samples),
+            "timeouts": sum(1 for _, timed_out in samples if timed_out),
+            "total s": round(sum(durations), 2),
+            "avg s": round(sum(durations) / len(durations), 2),
+            "max s": round(max(durations), 2),
+        })
+    return rows
+
+
+async def _ensure_page_events(tab):
+    if not tab.page_events_enabled:
+        await tab.enable_page_events()
+
+
+async def _wait_event(tab, event_name: str, action, timeout: float, step: str) -> float:
+    """Subscribe to event_name, run action(), then wait for the first event."""
+    loaded = asyncio.get_running_loop().create_future()
+
+    def on_event(_):
+        if not loaded.done():
+            loaded.set_result(None)
+
+    # 先订阅再触发动作，避免事件在订阅前就已经发生
+    callback_id = await tab.on(event_name, on_event)
+    start = time.perf_counter()
+    try:
+        if await action():
+            loaded.set_result(None)
+        await asyncio.wait_for(loaded, timeout)
+    except asyncio.TimeoutError:
+        _record(step, start, timed_out=True)
+        raise WaitTimeout(step, timeout) from None
+    finally:
+        await tab._connection_handler.remove_callback(callback_id)
+    return _record(step, start)
+
+
+async def navigate(tab, url: str, timeout: float = PAGE_LOAD_TIMEOUT, step: str = "navigate") -> float:
+    """Navigate and return as soon as Page.loadEventFired arrives.
+
+    Unlike tab.go_to() this does not poll document.readyState every 0.5 s.
+    """
+    await _ensure_page_events(tab)
+
+    async def send_navigate():
+        await tab._execute_command(PageCommands.navigate(url))
+        return False
+
+    return await _wait_event(tab, PageEvent.LOAD_EVENT_FIRED, send_navigate, timeout, step)
+
+
+async def wait_for_network_idle(tab, idle_time: float = NETWORK_IDLE_TIME,
+                                max_inflight: int = NETWORK_IDLE_MAX_INFLIGHT,
+                                timeout: float = NETWORK_IDLE_TIMEOUT, step: str = "network idle") -> float:
+    """Wait until at most max_inflight requests stay open for idle_time seconds.
+
+    Only requests started after the call are tracked.
+    """
+    inflight = set()
+    quiet_since = [time.perf_counter()]
+
+    def update():
+        if len(inflight) > max_inflight:
+            quiet_since[0] = None
+        elif quiet_since[0] is None:
+            quiet_since[0] = time.perf_counter()
+
+    def on_request(event):
+        inflight.add(event["params"]["requestId"])
+        update()
+
+    def on_done(event):
+        inflight.discard(event["params"]["requestId"])
+        update()
+
+    if not tab.network_events_enabled:
+        await tab.enable_network_events()
+    callback_ids = [
+        await tab.on(NetworkEvent.REQUEST_WILL_BE_SENT, on_request),
+        await tab.on(NetworkEvent.LOADING_FINISHED, on_done),
+        await tab.on(NetworkEvent.LOADING_FAILED, on_done),
+    ]
+    start = time.perf_counter()
+    deadline = start + timeout
+    try:
+        while True:
+            now = time.perf_counter()
+            if quiet_since[0] is not None and now - quiet_since[0] >= idle_time:
+                return _record(step, start)
+            if now >= deadline:
+                _record(step, start, timed_out=True)
+                raise WaitTimeout(step, timeout)
+            # 只在本地检查计数，不产生 CDP 往返
+            await asyncio.sleep(min(0.05, deadline - now))
+    finally:
+        for callback_id in callback_ids:
+            await tab._connection_handler.remove_callback(callback_id)
+
+
+async def wait_for_selector(tab, selector: str, timeout: float = SELECTOR_TIMEOUT,
+                            step: str = None, raise_exc: bool = True) -> bool:
+    """Wait for a CSS selector to match, using a MutationObserver inside the page.
+
+    The whole wait is a single CDP round trip. Returns False on timeout when
+    raise_exc is False.
+    """
+    step = step or f"selector {selector}"
+    expression = _SELECTOR_SCRIPT % (json.dumps(selector), int(timeout * 1000))
+    command = RuntimeCommands.evaluate(expression=expression, await_promise=True, return_by_value=True)
+    start = time.perf_counter()
+    try:
+        response = await tab._connection_handler.execute_command(command, timeout=int(timeout) + 5)
+        found = bool(response["result"].get("result", {}).get("value"))
+    except Exception as e:
+        # 等待期间页面跳转会销毁执行上下文
+        logging.warning(f"等待 {step} 时出错: {e}")
+        found = False
+
+    _record(step, start, timed_out=not found)
+    if not found and raise_exc:
+        raise WaitTimeout(step, timeout)
+    return found
@@ -0,0 +1,147 @@
+"""Per-run timing spans and a machine-readable run record.
+
+Phases (browser launch, first navigation, login, discovery, and per-topic
+navigate/scroll/actions) are wrapped in RUN.span(name). Each span is kept
+with its offset from the start of the run, its duration and any error. When
+the run ends, RUN.write() appends one JSON line to RUN_RECORD_PATH holding
+the spans, per-topic samples, counters and error messages, so durations can
+be charted across many scheduled runs.
+
+Log capture for notifications goes through RingBufferHandler, which keeps
+only the last LOG_BUFFER_LINES formatted lines instead of the whole run.
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from session_store import SESSION_DIR
+
+RUN_RECORD_PATH = os.getenv("RUN_RECORD_PATH", os.path.join(SESSION_DIR, "runs.jsonl"))
+LOG_BUFFER_LINES = int(os.getenv("LOG_BUFFER_LINES", "2000"))
+MAX_RECORDED_ERRORS = 50
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last `capacity` formatted log lines; getvalue() mirrors io.StringIO."""
+
+    def __init__(self, capacity: int = LOG_BUFFER_LINES, level=logging.NOTSET):
+        super().__init__(level)
+        self.lines = deque(maxlen=capacity)
+        self.errors = deque(maxlen=MAX_RECORDED_ERRORS)
+        self.dropped = 0
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.lines) == self.lines.maxlen:
+            self.dropped += 1
+        self.lines.append(line)
+        if record.levelno >= logging.ERROR:
+            self.errors.append(record.getMessage())
+
+    def getvalue(self) -> str:
+        head = f"... 省略了前 {self.dropped} 行日志 ...\n" if self.dropped else ""
+        return head + "".join(line + "\n" for line in self.lines)
+
+
+class RunRecorder:
+    """Spans and counters of one run; reset() starts a new run."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, engine: str = ""):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.engine = engine
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self.spans = []
+        self.counts = Counter()
+        self.topics = []
+        self.errors = []
+        self.extra = {}
+        self._stack = []
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Time the enclosed block; an exception is recorded on the span and re-raised."""
+        span = {"name": name, "start": round(time.perf_counter() - self._start, 3)}
+        if self._stack:
+            span["parent"] = self._stack[-1]
+        if attrs:
+            span["attrs"] = attrs
+        self._stack.append(name)
+        begin = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span["duration"] = round(time.perf_counter() - begin, 3)
+            self._stack.pop()
+            self.spans.append(span)
+
+    def topic(self, sample: dict):
+        """Per-topic measurements (performance metrics, memory) for the record."""
+        self.topics.append(sample)
+
+    def set(self, key: str, value):
+        """Extra top-level field of the record (e.g. deadline budgets)."""
+        self.extra[key] = value
+
+    def count(self, name: str, n: int = 1):
+        self.counts[name] += n
+
+    def error(self, message: str):
+        if len(self.errors) < MAX_RECORDED_ERRORS:
+            self.errors.append(message)
+
+    def phase_rows(self):
+        """Spans aggregated by name, for the end-of-run table."""
+        phases = {}
+        for span in self.spans:
+            row = phases.setdefault(span["name"], {"phase": span["name"], "count": 0, "total s": 0.0,
+                                                   "max s": 0.0, "errors": 0})
+            row["count"] += 1
+            row["total s"] += span["duration"]
+            row["max s"] = max(row["max s"], span["duration"])
+            row["errors"] += "error" in span
+        for row in phases.values():
+            row["total s"] = round(row["total s"], 2)
+        return list(phases.values())
+
+    def record(self, ok: bool, errors=()) -> dict:
+        return {
+            "run_id": self.run_id,
+            "engine": self.engine,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "duration": round(time.perf_counter() - self._start, 3),
+            "ok": ok,
+            "spans": self.spans,
+            "topics": self.topics,
+            "counts": dict(self.counts),
+            "errors": self.errors + [message for message in errors if message not in self.errors],
+            **self.extra,
+        }
+
+    def write(self, ok: bool, errors=(), path: str = RUN_RECORD_PATH):
+        """Append this run as one JSON line; `errors` adds messages captured elsewhere (e.g. the log buffer)."""
+        line = json.dumps(self.record(ok, errors), ensure_ascii=False)
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logging.warning(f"写入运行记录失败: {e}")
+
+
+RUN = RunRecorder()
@@ -0,0 +1,205 @@
+"""Topic progress that survives between runs.
+
+SeenIndex is an append-only JSONL file of topic ids, each with the time it
+was last visited and the highest post number read. It is loaded into a dict,
+so lookups stay O(1) however large the file grows, and every visit appends a
+single line. Compaction rewrites the file to drop superseded lines and
+entries older than SEEN_MAX_AGE. It only runs once the dead lines outnumber
+the live entries.
+
+RunCheckpoint stores the current run's planned topic list and the ids
+already finished. When a run dies halfway the file stays behind, and the
+next run resumes from it instead of starting over.
+
+Both live in SESSION_DIR next to the saved login session, so they are
+cached along with it.
+"""
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from session_store import SESSION_DIR
+
+SEEN_INDEX_PATH = os.getenv("SEEN_INDEX_PATH", os.path.join(SESSION_DIR, "seen.jsonl"))
+SEEN_MAX_AGE = float(os.getenv("SEEN_MAX_AGE", str(90 * 24 * 3600)))
+CHECKPOINT_MAX_AGE = float(os.getenv("CHECKPOINT_MAX_AGE", str(24 * 3600)))
+# 失效行少于这个数时不值得重写文件
+COMPACT_MIN_DEAD_LINES = 1000
+
+
+def _atomic_write(path: str, lines):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SeenIndex:
+    """topic id -> (last visited, highest post read), backed by an append-only JSONL file."""
+
+    def __init__(self, path: str = SEEN_INDEX_PATH, max_age: float = SEEN_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.skipped = 0
+        self._entries: Dict[int, Tuple[float, int]] = {}
+        self._lines = 0
+        self._file = None
+        self._load()
+
+    def _load(self):
+        try:
+            f = open(self.path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logging.warning(f"读取已读索引失败: {e}")
+            return
+        with f:
+            for line in f:
+                self._lines += 1
+                try:
+                    record = json.loads(line)
+                    self._entries[int(record["id"])] = (float(record["t"]), int(record["p"]))
+                except (ValueError, KeyError, TypeError):
+                    # 进程中途退出时最后一行可能只写了一半
+                    continue
+
+    def _append_handle(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a+", encoding="utf-8")
+            # 上次写了一半的行没有换行符，先补上，避免和新行粘在一起
+            if self._file.tell() > 0:
+                self._file.seek(self._file.tell() - 1)
+                if self._file.read(1) != "\n":
+                    self._file.write("\n")
+        return self._file
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, topic_id) -> bool:
+        return topic_id in self._entries
+
+    def get(self, topic_id: int) -> Optional[Tuple[float, int]]:
+        return self._entries.get(topic_id)
+
+    def is_read(self, topic_id: int, highest_post: int) -> bool:
+        """True if every post up to highest_post was read; unknown sizes (0) never count as read."""
+        entry = self._entries.get(topic_id)
+        return entry is not None and highest_post > 0 and entry[1] >= highest_post
+
+    def mark(self, topic_id: int, post: int):
+        previous = self._entries.get(topic_id)
+        post = max(post, previous[1]) if previous else post
+        now = time.time()
+        self._entries[topic_id] = (now, post)
+        try:
+            f = self._append_handle()
+            f.write(json.dumps({"id": topic_id, "t": round(now), "p": post}) + "\n")
+            f.flush()
+            self._lines += 1
+        except OSError as e:
+            logging.warning(f"写入已读索引失败: {e}")
+
+    def compact(self, force: bool = False) -> bool:
+        """Drop expired entries and superseded lines; returns True if the file was rewritten."""
+        cutoff = time.time() - self.max_age
+        live = {topic_id: entry for topic_id, entry in self._entries.items() if entry[0] >= cutoff}
+        dead = self._lines - len(live)
+        if not force and dead < max(COMPACT_MIN_DEAD_LINES, len(live)):
+            return False
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            _atomic_write(self.path, (json.dumps({"id": topic_id, "t": round(t), "p": p}) + "\n"
+                                      for topic_id, (t, p) in live.items()))
+        except OSError as e:
+            logging.warning(f"压缩已读索引失败: {e}")
+            return False
+        logging.info(f"已读索引压缩完成：{self._lines} 行 -> {len(live)} 行")
+        self._entries = live
+        self._lines = len(live)
+        return True
+
+    def close(self):
+        self.compact()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def summary(self) -> dict:
+        return {"topics": len(self._entries), "lines": self._lines, "skipped": self.skipped}
+
+
+class RunCheckpoint:
+    """Planned topics and finished ids of the current run; `key` names the id field of each topic."""
+
+    def __init__(self, name: str, key: str = "id", directory: str = SESSION_DIR, max_age: float = CHECKPOINT_MAX_AGE):
+        self.path = os.path.join(directory, f"{name}.checkpoint.json")
+        self.key = key
+        self.max_age = max_age
+        self.topics: List[dict] = []
+        self.done = set()
+        self.started_at = None
+
+    def resume(self) -> Optional[List[dict]]:
+        """The unfinished topics of an interrupted run, or None if there is nothing to resume."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"读取运行检查点失败: {e}")
+            return None
+        if time.time() - state.get("started_at", 0) > self.max_age:
+            logging.info("运行检查点已过期，重新开始")
+            self.finish()
+            return None
+        self.topics = state.get("topics", [])
+        self.done = set(state.get("done", []))
+        self.started_at = state["started_at"]
+        remaining = self.remaining()
+        if not remaining:
+            # 上次运行处理完所有主题但没来得及删除检查点
+            logging.info("运行检查点中的主题已全部完成，重新开始")
+            self.finish()
+            return None
+        logging.info(f"从检查点恢复上次中断的运行：已完成 {len(self.done)}/{len(self.topics)} 个主题")
+        return remaining
+
+    def start(self, topics: List[dict]):
+        self.topics = list(topics)
+        self.done = set()
+        self.started_at = time.time()
+        self._write()
+
+    def advance(self, topic_id):
+        self.done.add(topic_id)
+        self._write()
+
+    def remaining(self) -> List[dict]:
+        return [topic for topic in self.topics if topic.get(self.key) not in self.done]
+
+    def finish(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"删除运行检查点失败: {e}")
+
+    def _write(self):
+        state = {"started_at": self.started_at, "topics": self.topics, "done": sorted(self.done, key=str)}
+        try:
+            _atomic_write(self.path, [json.dumps(state, ensure_ascii=False)])
+        except OSError as e:
+            logging.warning(f"写入运行检查点失败: {e}")
@@ -0,0 +1,169 @@
+"""In-page scroll driver, shared by both browser engines.
+
+The driver script is installed once per tab (Page.addScriptToEvaluateOnNewDocument,
+so it survives navigation) together with a Runtime binding. Each run is
+started with a single evaluate call. The page then scrolls itself and calls
+the binding once, either when it reaches the bottom and the height has stopped
+growing, or when its time budget runs out. Python only waits for that one
+Runtime.bindingCalled event, so there are no CDP round trips per scroll step.
+
+The Playwright engine installs the same DRIVER_SOURCE as an init script and
+starts a run with RUN_AND_WAIT, which resolves when the driver reports.
+"""
+import asyncio
+import json
+import time
+import uuid
+
+try:
+    from pydoll.commands import PageCommands, RuntimeCommands
+    from pydoll.protocol.runtime.events import RuntimeEvent
+
+    from cdp_session import session_for
+except ImportError:  # 只装了 Playwright 时只用到驱动脚本本身
+    PageCommands = RuntimeCommands = RuntimeEvent = session_for = None
+
+BINDING_NAME = "__linuxdoScrollDone"
+
+DRIVER_SOURCE = """(() => {
+  if (window.__linuxdoScroll) return;
+  const rand = (min, max) => min + Math.random() * (max - min);
+  const pageHeight = () => document.documentElement.scrollHeight;
+  let current = null;
+
+  function finish(run, reason) {
+    if (current !== run) return;
+    current = null;
+    window.%(binding)s(JSON.stringify({
+      token: run.token,
+      reason: reason,
+      height: pageHeight(),
+      scrolled: Math.round(window.scrollY + window.innerHeight),
+      steps: run.steps,
+      elapsed: Date.now() - run.started,
+    }));
+  }
+
+  function tick(run) {
+    if (current !== run) return;
+    const now = Date.now();
+    if (now - run.started >= run.budget) return finish(run, 'budget');
+    const height = pageHeight();
+    const atBottom = window.scrollY + window.innerHeight >= height - 2;
+    if (atBottom) {
+      // 到底后再观察一段时间，高度不再增长（没有懒加载新帖子）才算读完
+      if (run.bottomSince === null || height > run.bottomHeight) {
+        run.bottomSince = now;
+        run.bottomHeight = height;
+      } else if (now - run.bottomSince >= run.settle) {
+        return finish(run, 'bottom');
+      }
+    } else {
+      run.bottomSince = null;
+      window.scrollBy({top: rand(run.stepMin, run.stepMax), left: 0, behavior: 'smooth'});
+      run.steps += 1;
+    }
+    setTimeout(() => tick(run), rand(run.pauseMin, run.pauseMax));
+  }
+
+  window.__linuxdoScroll = {
+    start(options) {
+      const run = Object.assign({steps: 0, started: Date.now(), bottomSince: null, bottomHeight: 0}, options);
+      current = run;
+      tick(run);
+      return true;
+    },
+    stop() { current = null; },
+  };
+})();""" % {"binding": BINDING_NAME}
+
+# 不经过 CDP binding 的启动方式：返回的 Promise 在驱动回报时完成
+RUN_AND_WAIT = """(options) => new Promise((resolve) => {
+  if (!window.__linuxdoScroll) return resolve(null);
+  window.%(binding)s = (payload) => resolve(JSON.parse(payload));
+  window.__linuxdoScroll.start(options);
+})""" % {"binding": BINDING_NAME}
+
+
+def run_options(token: str, budget: float, step=(300, 600), pause=(0.5, 1.5), settle: float = 1.5) -> dict:
+    """Options of one driver run; times are passed to the page in milliseconds."""
+    return {
+        "token": token,
+        "budget": int(budget * 1000),
+        "stepMin": step[0], "stepMax": step[1],
+        "pauseMin": int(pause[0] * 1000), "pauseMax": int(pause[1] * 1000),
+        "settle": int(settle * 1000),
+    }
+
+
+class ScrollDriver:
+    """Runs the in-page scroll driver on one tab and waits for its report."""
+
+    def __init__(self, tab):
+        self.tab = tab
+        self.session = session_for(tab)
+        self._installed = False
+
+    async def install(self):
+        """Register the binding and the driver script; only the first call does work."""
+        if self._installed:
+            return
+        if not self.tab.runtime_events_enabled:
+            await self.tab.enable_runtime_events()
+        await self.session.pipeline(
+            RuntimeCommands.add_binding(BINDING_NAME),
+            PageCommands.add_script_to_evaluate_on_new_document(DRIVER_SOURCE, run_immediately=True),
+        )
+        self._installed = True
+
+    async def _start(self, options: dict) -> bool:
+        expression = f"window.__linuxdoScroll ? window.__linuxdoScroll.start({json.dumps(options)}) : false"
+        response = await self.session.execute(RuntimeCommands.evaluate(expression=expression, return_by_value=True))
+        return bool(response.get("result", {}).get("result", {}).get("value"))
+
+    async def run(self, budget: float, step=(300, 600), pause=(0.5, 1.5), settle: float = 1.5) -> dict:
+        """Scroll until the bottom or `budget` seconds; returns the page's report.
+
+        The report has reason ('bottom', 'budget' or 'timeout'), height,
+        scrolled, steps and elapsed (ms).
+        """
+        await self.install()
+        token = uuid.uuid4().hex
+        done = asyncio.get_running_loop().create_future()
+
+        def on_binding(event):
+            params = event.get("params", {})
+            if params.get("name") != BINDING_NAME or done.done():
+                return
+            try:
+                report = json.loads(params.get("payload") or "{}")
+            except ValueError:
+                return
+            if report.get("token") == token:
+                done.set_result(report)
+
+        options = run_options(token, budget, step, pause, settle)
+        callback_id = await self.tab.on(RuntimeEvent.BINDING_CALLED, on_binding)
+        start = time.perf_counter()
+        try:
+            if not await self._start(options):
+                # 旧版 Chrome 不支持 runImmediately，当前文档里补注入一次
+                await self.session.execute(RuntimeCommands.evaluate(expression=DRIVER_SOURCE))
+                await self._start(options)
+            report = await asyncio.wait_for(done, budget + settle + 5)
+        except asyncio.TimeoutError:
+            # 页面跳转或标签页挂起时驱动不会回报
+            report = {"reason": "timeout", "elapsed": int((time.perf_counter() - start) * 1000)}
+        finally:
+            await self.tab._connection_handler.remove_callback(callback_id)
+        return report
+
+
+def scroll_driver_for(tab) -> ScrollDriver:
+    """The tab's ScrollDriver, created on first use."""
+    handler = tab._connection_handler
+    driver = getattr(handler, "_scroll_driver", None)
+    if driver is None:
+        driver = ScrollDriver(tab)
+        handler._scroll_driver = driver
+    return driver
@@ -0,0 +1,155 @@
+"""Encrypted persistence of the logged-in browser session.
+
+After a successful login the cookies (pydoll) or storage state (Playwright)
+are written to disk encrypted with Fernet. The key is derived with PBKDF2
+from SESSION_SECRET, falling back to the account password. On the next run
+the saved state is restored and checked with a single request to
+/session/current.json. The full login flow only runs when that check fails.
+
+Encryption needs the optional `cryptography` package. Without it, nothing
+is written to disk and every run logs in as before.
+
+Hits, misses and the time saved are kept in a small plain JSON file next to
+the session (it holds no secrets), so the hit rate covers every run.
+"""
+import base64
+import json
+import logging
+import os
+import time
+from urllib.parse import urlparse
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+except ImportError:  # 可选依赖
+    Fernet = None
+
+SESSION_DIR = os.getenv("SESSION_DIR", "session")
+SESSION_MAX_AGE = float(os.getenv("SESSION_MAX_AGE", str(7 * 24 * 3600)))
+KDF_ITERATIONS = 200_000
+
+# 在已登录的页面内检查会话是否仍然有效，两个引擎共用
+SESSION_CHECK = """async () => {
+  try {
+    const response = await fetch('/session/current.json', {credentials: 'same-origin', headers: {'Accept': 'application/json'}});
+    if (!response.ok) return {valid: false, status: response.status};
+    const data = await response.json();
+    return {valid: !!(data.current_user && data.current_user.username), status: response.status,
+            username: data.current_user ? data.current_user.username : null};
+  } catch (e) {
+    return {valid: false, status: 0, error: String(e)};
+  }
+}"""
+
+
+def encryption_available() -> bool:
+    return Fernet is not None
+
+
+# Network.setCookies 接受的字段；getCookies 返回的 size/session 等字段不能原样传回
+_COOKIE_PARAM_KEYS = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires")
+
+
+def site_cookies(cookies, home_url: str):
+    """CDP cookies belonging to home_url's site, reduced to CookieParam fields."""
+    host = urlparse(home_url).hostname or ""
+    kept = []
+    for cookie in cookies:
+        domain = cookie.get("domain", "").lstrip(".")
+        if not domain or not (host == domain or host.endswith("." + domain)):
+            continue
+        param = {key: cookie[key] for key in _COOKIE_PARAM_KEYS if key in cookie}
+        if cookie.get("session") or param.get("expires", -1) < 0:
+            param.pop("expires", None)
+        kept.append(param)
+    return kept
+
+
+class SessionStore:
+    """One encrypted session file plus its hit/miss statistics."""
+
+    def __init__(self, name: str, secret: str, directory: str = SESSION_DIR, max_age: float = SESSION_MAX_AGE):
+        self.path = os.path.join(directory, f"{name}.session")
+        self.stats_path = os.path.join(directory, f"{name}.stats.json")
+        self.secret = secret or ""
+        self.max_age = max_age
+        self.enabled = encryption_available() and bool(self.secret)
+        if not encryption_available():
+            logging.info("未安装 cryptography，不保存登录会话（pip install cryptography 可开启）")
+
+    def _fernet(self, salt: bytes):
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=KDF_ITERATIONS)
+        return Fernet(base64.urlsafe_b64encode(kdf.derive(self.secret.encode("utf-8"))))
+
+    def load(self):
+        """The saved state, or None if missing, expired or undecryptable."""
+        if not self.enabled or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                envelope = json.load(f)
+            if time.time() - envelope.get("saved_at", 0) > self.max_age:
+                logging.info("保存的会话已超过最长保留时间，重新登录")
+                return None
+            salt = base64.b64decode(envelope["salt"])
+            return json.loads(self._fernet(salt).decrypt(envelope["token"].encode("ascii")))
+        except (OSError, ValueError, KeyError, InvalidToken) as e:
+            logging.warning(f"读取保存的会话失败: {e!r}")
+            return None
+
+    def save(self, state):
+        if not self.enabled:
+            return
+        salt = os.urandom(16)
+        token = self._fernet(salt).encrypt(json.dumps(state).encode("utf-8"))
+        envelope = {"saved_at": time.time(), "salt": base64.b64encode(salt).decode("ascii"),
+                    "token": token.decode("ascii")}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        # 先写临时文件再替换，并限制为仅当前用户可读
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as f:
+            json.dump(envelope, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _load_stats(self) -> dict:
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"hits": 0, "misses": 0, "login_seconds": 0.0, "saved_seconds": 0.0}
+
+    def _save_stats(self, stats: dict):
+        try:
+            os.makedirs(os.path.dirname(self.stats_path) or ".", exist_ok=True)
+            with open(self.stats_path, "w", encoding="utf-8") as f:
+                json.dump(stats, f)
+        except OSError as e:
+            logging.warning(f"保存会话统计失败: {e}")
+
+    def record(self, hit: bool, seconds: float):
+        """Record one run: `seconds` is the check time on a hit, the login time on a miss."""
+        stats = self._load_stats()
+        saved = 0.0
+        if hit:
+            stats["hits"] += 1
+            saved = max(0.0, stats["login_seconds"] - seconds)
+            stats["saved_seconds"] += saved
+        else:
+            stats["misses"] += 1
+            # 平均登录耗时用于估算每次命中节省的时间
+            previous = stats["login_seconds"]
+            stats["login_seconds"] = seconds if not previous else 0.8 * previous + 0.2 * seconds
+        self._save_stats(stats)
+
+        total = stats["hits"] + stats["misses"]
+        logging.info(
+            f"会话复用{'命中' if hit else '未命中'}，本次{'检查' if hit else '登录'}用时 {seconds:.2f} 秒，"
+            f"节省约 {saved:.1f} 秒；累计命中率 {stats['hits']}/{total} "
+            f"({stats['hits'] / total:.0%})，累计节省 {stats['saved_seconds']:.0f} 秒"
+        )
@@ -0,0 +1,71 @@
+"""Incremental Server-Sent Events decoder.
+
+Bytes are fed in arbitrary chunks. Complete events are split out at the byte
+level (a "\\n\\n" separator can never occur inside a multibyte UTF-8 sequence),
+so characters split across chunks are reassembled before decoding and the
+buffer is never re-scanned from the start.
+"""
+from typing import AsyncIterable, List, NamedTuple, Optional
+
+
+class SSEEvent(NamedTuple):
+    event: Optional[str]
+    data: Optional[str]
+
+
+class SSEDecoder:
+    """Feed raw bytes, get back complete (event, data) records."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scan_pos = 0
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """Append a chunk and return every event completed by it."""
+        if not chunk:
+            return []
+
+        buffer = self._buffer
+        buffer += chunk
+        events = []
+        start = 0
+        # 只从上次未扫描的位置继续查找分隔符
+        pos = self._scan_pos
+        while True:
+            idx = buffer.find(b"\n\n", pos)
+            if idx == -1:
+                break
+            event = _parse_block(buffer[start:idx])
+            if event is not None:
+                events.append(event)
+            start = pos = idx + 2
+
+        if start:
+            del buffer[:start]
+        # 分隔符可能跨越两个 chunk，保留最后一个字节重新扫描
+        self._scan_pos = max(len(buffer) - 1, 0)
+        return events
+
+
+def _parse_block(block: bytearray) -> Optional[SSEEvent]:
+    """Parse one event block; returns None for blank or comment-only blocks."""
+    event_type = None
+    data_lines = []
+    for line in block.decode("utf-8", errors="replace").split("\n"):
+        line = line.strip()
+        if line.startswith("event:"):
+            event_type = line[6:].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[5:].strip())
+
+    if event_type is None and not data_lines:
+        return None
+    return SSEEvent(event_type, "\n".join(data_lines) if data_lines else None)
+
+
+async def aiter_sse(chunks: AsyncIterable[bytes]):
+    """Decode an asynchronous iterable of byte chunks (e.g. httpx aiter_bytes)."""
+    decoder = SSEDecoder()
+    async for chunk in chunks:
+        for event in decoder.feed(chunk):
+            yield event
@@ -0,0 +1,142 @@
+"""Warm tab reuse for topic visits.
+
+Instead of creating and closing a target for every topic, topics are opened
+in a small pool of tabs (size 1 by default) by navigating the same tab again.
+A released tab is parked on about:blank, so the previous topic's document,
+timers and JS heap are dropped before the next visit, and its navigation
+history is cleared. After max_uses visits the tab is closed and replaced, so
+leaks in long-lived renderers stay bounded.
+
+TabPool is for pydoll tabs and PagePool for async Playwright pages; they
+back the two engines' page_pool(). Both count how many tabs were created,
+reused and recycled.
+"""
+import asyncio
+import logging
+import os
+
+TAB_POOL_SIZE = int(os.getenv("TAB_POOL_SIZE", "1"))
+TAB_POOL_MAX_USES = int(os.getenv("TAB_POOL_MAX_USES", "50"))
+
+
+class _PoolStats:
+    def __init__(self):
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+
+    def summary(self) -> dict:
+        return {"created": self.created, "reused": self.reused, "recycled": self.recycled}
+
+
+class TabPool(_PoolStats):
+    """Pool of pydoll tabs in one browser context; on_create(tab) runs once for every new tab."""
+
+    def __init__(self, browser, size: int = TAB_POOL_SIZE, max_uses: int = TAB_POOL_MAX_USES, on_create=None,
+                 browser_context_id=None):
+        super().__init__()
+        self.browser = browser
+        self.browser_context_id = browser_context_id
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.on_create = on_create
+        self._idle = asyncio.Queue()
+        self._uses = {}
+        self._open = 0
+
+    async def _create(self):
+        tab = await self.browser.new_tab(browser_context_id=self.browser_context_id)
+        self._open += 1
+        self.created += 1
+        self._uses[tab._target_id] = 0
+        if self.on_create:
+            await self.on_create(tab)
+        return tab
+
+    async def acquire(self):
+        if self._idle.empty() and self._open < self.size:
+            tab = await self._create()
+        else:
+            tab = await self._idle.get()
+            self.reused += 1
+        self._uses[tab._target_id] += 1
+        return tab
+
+    async def release(self, tab, broken: bool = False):
+        """Return a tab; broken tabs and tabs past max_uses are closed and replaced lazily."""
+        from pydoll.commands import PageCommands
+
+        from readiness import navigate
+
+        if not broken and self._uses.get(tab._target_id, 0) < self.max_uses:
+            try:
+                # 先换到空白页，释放上一个主题的文档、定时器和 JS 堆
+                await navigate(tab, "about:blank", timeout=10, step="标签页清空")
+                await tab._execute_command(PageCommands.reset_navigation_history())
+                self._idle.put_nowait(tab)
+                return
+            except Exception as e:
+                logging.warning(f"重置标签页失败，改为关闭: {e}")
+        await self._discard(tab)
+        self.recycled += 1
+
+    async def _discard(self, tab):
+        self._open -= 1
+        self._uses.pop(tab._target_id, None)
+        try:
+            await tab.close()
+        except Exception as e:
+            logging.warning(f"关闭标签页失败: {e}")
+
+    async def close(self):
+        while not self._idle.empty():
+            await self._discard(self._idle.get_nowait())
+
+
+class PagePool(_PoolStats):
+    """Same idea for an async Playwright BrowserContext."""
+
+    def __init__(self, context, size: int = TAB_POOL_SIZE, max_uses: int = TAB_POOL_MAX_USES):
+        super().__init__()
+        self.context = context
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self._idle = asyncio.Queue()
+        self._uses = {}
+        self._open = 0
+
+    async def acquire(self):
+        if self._idle.empty() and self._open < self.size:
+            page = await self.context.new_page()
+            self._open += 1
+            self.created += 1
+            self._uses[id(page)] = 0
+        else:
+            page = await self._idle.get()
+            self.reused += 1
+        self._uses[id(page)] += 1
+        return page
+
+    async def release(self, page, broken: bool = False):
+        if not broken and not page.is_closed() and self._uses.get(id(page), 0) < self.max_uses:
+            try:
+                await page.goto("about:blank", timeout=10000)
+                self._idle.put_nowait(page)
+                return
+            except Exception as e:
+                logging.warning(f"页面切换到空白页失败，改为关闭: {e}")
+        await self._discard(page)
+        self.recycled += 1
+
+    async def _discard(self, page):
+        self._open -= 1
+        self._uses.pop(id(page), None)
+        try:
+            if not page.is_closed():
+                await page.close()
+        except Exception as e:
+            logging.warning(f"关闭页面失败: {e}")
+
+    async def close(self):
+        while not self._idle.empty():
+            await self._discard(self._idle.get_nowait())